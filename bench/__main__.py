@@ -0,0 +1,291 @@
+"""Офлайн-бенчмарк бота: python -m bench [--scenario NAME] [--json PATH].
+
+Прогоняет основные пути (initial_check, publish_daily_post, publish_second_post,
+ensure_month_sheet) на локальных заменителях из bench.fakes и печатает
+время, число обращений к API и пропускную способность.
+"""
+import argparse
+import asyncio
+import calendar
+import datetime
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_setup  # noqa: E402
+import main as bot_main  # noqa: E402
+import metrics  # noqa: E402
+import openai_client  # noqa: E402
+import plan_store  # noqa: E402
+import publish_journal  # noqa: E402
+import resilience  # noqa: E402
+import sheets_client  # noqa: E402
+import telegram_client  # noqa: E402
+import topic_planner  # noqa: E402
+import tenants  # noqa: E402
+from bench.fakes import FakeBot, FakeOpenAI, FakeSpreadsheet  # noqa: E402
+
+SCENARIOS = {}
+
+
+def scenario(func):
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+def _month_name(day):
+    return f"{day.year}-{day.month:02d}"
+
+
+def _topics(count, prefix="Тема"):
+    return [f"{prefix} {i}: обслуживание спецтехники" for i in range(1, count + 1)]
+
+
+class Env:
+    """Окружение одного прогона: заменители, свежий plan.db и конфиг."""
+
+    def __init__(self, args, openai_kwargs=None, bot_kwargs=None, sheets_kwargs=None):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.openai = FakeOpenAI(latency=args.openai_latency, seed=args.seed, **(openai_kwargs or {}))
+        self.bot = FakeBot(latency=args.telegram_latency, seed=args.seed, **(bot_kwargs or {}))
+        self.sheet = FakeSpreadsheet(latency=args.sheets_latency, seed=args.seed, **(sheets_kwargs or {}))
+
+        self.config = bot_main.load_config()
+        self.config.update({
+            "model_main": "fake-main",
+            "model_second": "fake-second",
+            "channels": [{"chat_id": f"@bench_channel_{i}", "bot_username": "bench_bot"} for i in range(args.channels)],
+            "image_urls": [os.path.join(self.tmp.name, "promo.jpg")],
+            "plan_db_path": os.path.join(self.tmp.name, "plan.db"),
+            "catchup_concurrency": args.concurrency,
+        })
+        with open(self.config["image_urls"][0], "wb") as f:
+            f.write(b"fake image")
+
+        plan_store._store = None
+        plan_store.init_store(self.config["plan_db_path"])
+        publish_journal._journal = None
+        publish_journal.init_journal(os.path.join(self.tmp.name, "publish.journal"))
+        sheets_client._worksheets.clear()
+        sheets_client._publish_locks.clear()
+        topic_planner._locks.clear()
+        metrics.reset()
+        openai_client.configure("bench-key", base_url="http://fake-openai/v1", transport=self.openai.transport)
+        telegram_client.configure_rate_limiter(
+            self.config["telegram_global_rate"],
+            self.config["telegram_chat_rate"] if not args.no_rate_limit else 1000,
+            self.config["telegram_group_per_minute"] if not args.no_rate_limit else 100000,
+        )
+        resilience.configure(base_delay=args.retry_delay, max_delay=args.retry_delay * 4)
+
+    @property
+    def now(self):
+        return datetime.datetime.now(pytz.timezone(self.config["timezone"]))
+
+    async def close(self):
+        # Фоновое планирование тем на год вперёд в замер не входит
+        refills = list(topic_planner._refilling.values())
+        for task in refills:
+            task.cancel()
+        await asyncio.gather(*refills, return_exceptions=True)
+        await openai_client.close_client()
+        plan_store.get_store().close()
+        plan_store._store = None
+        publish_journal.get_journal().close()
+        publish_journal._journal = None
+        self.tmp.cleanup()
+
+    def report(self, name, wall, posts):
+        return {
+            "scenario": name,
+            "wall_seconds": round(wall, 3),
+            "posts_sent": posts,
+            "posts_per_second": round(posts / wall, 3) if wall else None,
+            "openai": dict(self.openai.counts),
+            "telegram": dict(self.bot.counts),
+            "sheets": dict(self.sheet.counts),
+            "sheets_api_calls": self.sheet.api_calls,
+        }
+
+
+@scenario
+async def backlog_30(args):
+    """Перезапуск после простоя: весь прошлый месяц (28-31 пост) не опубликован."""
+    env = Env(args)
+    now = env.now
+    prev = (now.replace(day=1) - datetime.timedelta(days=1))
+    env.sheet.add_month(_month_name(prev), _topics(calendar.monthrange(prev.year, prev.month)[1]))
+    env.sheet.add_month(_month_name(now), _topics(calendar.monthrange(now.year, now.month)[1]), published=now.day)
+    start = time.monotonic()
+    await bot_main.initial_check(env.sheet, env.config, env.bot)
+    wall = time.monotonic() - start
+    result = env.report("backlog_30", wall, env.bot.counts["send_message"])
+    await env.close()
+    return result
+
+
+@scenario
+async def cold_start(args):
+    """Пустая таблица: создаются два месяца, темы и догоняющая публикация текущего месяца."""
+    env = Env(args)
+    start = time.monotonic()
+    await bot_main.initial_check(env.sheet, env.config, env.bot)
+    wall = time.monotonic() - start
+    result = env.report("cold_start", wall, env.bot.counts["send_message"])
+    await env.close()
+    return result
+
+
+@scenario
+async def daily_post(args):
+    """Плановый пост в 9:00 при тёплом зеркале и готовом тексте из предгенерации."""
+    env = Env(args)
+    now = env.now
+    env.sheet.add_month(_month_name(now), _topics(calendar.monthrange(now.year, now.month)[1]), published=now.day - 1)
+    await sheets_client.reconcile_months(env.sheet, [_month_name(now)])
+    await sheets_client.pregenerate_posts(env.sheet, env.config)
+    env.sheet.counts.clear()
+    env.openai.counts.clear()
+    start = time.monotonic()
+    await bot_main.publish_daily_post(env.sheet, env.config, env.bot)
+    wall = time.monotonic() - start
+    result = env.report("daily_post", wall, env.bot.counts["send_message"])
+    await env.close()
+    return result
+
+
+@scenario
+async def second_posts(args):
+    """Три промо-поста за день: первый с пустым пулом, остальные из пула."""
+    env = Env(args)
+    start = time.monotonic()
+    for _ in range(3):
+        await bot_main.publish_second_post(env.bot, env.config)
+        await asyncio.sleep(0)
+    wall = time.monotonic() - start
+    result = env.report("second_posts", wall, env.bot.counts["send_photo"])
+    await env.close()
+    return result
+
+
+@scenario
+async def ensure_month(args):
+    """Создание листа на следующий месяц с генерацией тем."""
+    env = Env(args)
+    now = env.now
+    start = time.monotonic()
+    await sheets_client.ensure_month_sheet(env.sheet, now.year + 1, now.month, env.config)
+    wall = time.monotonic() - start
+    result = env.report("ensure_month", wall, 0)
+    await env.close()
+    return result
+
+
+@scenario
+async def flaky_backlog(args):
+    """Бэклог при нестабильных сервисах: ошибки OpenAI и Telegram, RetryAfter."""
+    env = Env(
+        args,
+        openai_kwargs={"error_rate": 0.1, "rate_limit_rate": 0.1},
+        bot_kwargs={"error_rate": 0.05, "retry_after_rate": 0.1},
+    )
+    now = env.now
+    prev = (now.replace(day=1) - datetime.timedelta(days=1))
+    env.sheet.add_month(_month_name(prev), _topics(calendar.monthrange(prev.year, prev.month)[1]))
+    env.sheet.add_month(_month_name(now), _topics(calendar.monthrange(now.year, now.month)[1]), published=now.day)
+    start = time.monotonic()
+    await bot_main.initial_check(env.sheet, env.config, env.bot)
+    wall = time.monotonic() - start
+    result = env.report("flaky_backlog", wall, env.bot.counts["send_message"] - env.bot.counts["errors"] - env.bot.counts["retry_after"])
+    await env.close()
+    return result
+
+
+@scenario
+async def tenants_3(args):
+    """Три клиента в одном процессе: догоняющая публикация одновременно, у третьего таблица недоступна."""
+    env = Env(args)
+    now = env.now
+    days = calendar.monthrange(now.year, now.month)[1]
+    runs = []
+    for i in range(3):
+        config = {
+            **env.config,
+            "tenant_id": f"bench{i}",
+            "company_name": f"Компания {i}",
+            "channels": [{"chat_id": f"@bench{i}_channel", "bot_username": "bench_bot"}],
+        }
+        sheet = FakeSpreadsheet(
+            latency=args.sheets_latency, seed=args.seed, error_rate=1.0 if i == 2 else 0.0,
+            spreadsheet_id=f"fake-spreadsheet-{i}",
+        )
+        sheet.add_month(_month_name(now), _topics(days, prefix=f"Клиент {i}, тема"), published=max(now.day - 10, 0))
+        runs.append((config, sheet))
+    start = time.monotonic()
+    tasks = []
+    for config, sheet in runs:
+        with tenants.use(config):
+            tasks.append(asyncio.create_task(bot_main.run_initial_check(sheet, config, env.bot)))
+    await asyncio.gather(*tasks)
+    wall = time.monotonic() - start
+    result = env.report("tenants_3", wall, env.bot.counts["send_message"])
+    result["sheets"] = {config["tenant_id"]: dict(sheet.counts) for config, sheet in runs}
+    result["sheets_api_calls"] = sum(sheet.api_calls for _, sheet in runs)
+    await env.close()
+    return result
+
+
+def _print(result):
+    print(f"\n== {result['scenario']} ==")
+    print(f"  время: {result['wall_seconds']} c, постов: {result['posts_sent']}, постов/с: {result['posts_per_second']}")
+    print(f"  OpenAI:   {result['openai']}")
+    print(f"  Telegram: {result['telegram']}")
+    print(f"  Sheets:   {result['sheets_api_calls']} вызовов {result['sheets']}")
+
+
+async def run(args):
+    names = args.scenario or list(SCENARIOS)
+    results = []
+    for name in names:
+        results.append(await SCENARIOS[name](args))
+        _print(results[-1])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк post_bot")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="сценарий (можно несколько)")
+    parser.add_argument("--json", help="куда записать результаты в JSON")
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--sheets-latency", type=float, default=0.2)
+    parser.add_argument("--retry-delay", type=float, default=0.1, help="базовая пауза между повторами вместо боевой")
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--no-rate-limit", action="store_true", help="снять лимиты Telegram на чат")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.verbose:
+        log_listener = log_setup.setup_logging("DEBUG", log_file=None)
+    else:
+        logging.getLogger("post_bot").setLevel(logging.CRITICAL)
+    try:
+        asyncio.run(run(args))
+    finally:
+        if args.verbose:
+            log_listener.stop()
@@ -0,0 +1,270 @@
+"""Локальные заменители OpenAI, Telegram и Google Sheets для бенчмарков.
+
+У каждого заменителя настраиваются задержка, доля ошибок и (для Telegram)
+доля ответов RetryAfter; все вызовы считаются в counts.
+"""
+import asyncio
+import collections
+import json
+import random
+import re
+import threading
+import time
+
+import gspread
+import httpx
+from gspread.utils import a1_to_rowcol
+from telegram.error import RetryAfter, TimedOut
+
+TOPIC_ANGLES = ["Диагностика", "Плановое ТО", "Типичные поломки", "Зимняя эксплуатация", "Выбор запчастей", "Ремонт в полевых условиях"]
+TOPIC_PARTS = ["гидравлики", "двигателя", "трансмиссии", "ходовой части", "электрики", "тормозной системы", "системы охлаждения", "топливной системы"]
+TOPIC_MACHINES = ["экскаватора", "бульдозера", "погрузчика", "автокрана", "грейдера", "катка", "самосвала", "трактора"]
+
+
+class FakeOpenAI:
+    """OpenAI-совместимый HTTP-сервер для httpx.MockTransport."""
+
+    def __init__(self, latency=0.5, error_rate=0.0, rate_limit_rate=0.0, chars_per_second=4000, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.chars_per_second = chars_per_second
+        self.random = random.Random(seed)
+        self.counts = collections.Counter()
+        self.transport = httpx.MockTransport(self.handle)
+
+    def _text(self, messages):
+        prompt = messages[-1]["content"]
+        match = re.search(r"из (\d+)", prompt)
+        if match and "тем" in prompt:
+            # Случайные сочетания: часть тем неизбежно повторяется, как и у настоящей модели
+            self.counts["topic_lists"] += 1
+            return "\n".join(
+                f"{i}. {self.random.choice(TOPIC_ANGLES)}: {self.random.choice(TOPIC_PARTS)} {self.random.choice(TOPIC_MACHINES)}"
+                for i in range(1, int(match.group(1)) + 1)
+            )
+        words = ["гидравлика", "фильтр", "насос", "ковш", "двигатель", "ремонт", "запчасти", "скидка", "сервис", "масло"]
+        sentences = [
+            " ".join(self.random.choice(words) for _ in range(10)).capitalize() + "."
+            for _ in range(25)
+        ]
+        return " ".join(sentences)
+
+    async def handle(self, request):
+        body = json.loads(request.content)
+        self.counts["requests"] += 1
+        await asyncio.sleep(self.latency)
+        roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            self.counts["rate_limited"] += 1
+            return httpx.Response(429, json={"error": {"message": "rate limited"}}, headers={"retry-after": "0.1"})
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.counts["errors"] += 1
+            return httpx.Response(500, json={"error": {"message": "fake server error"}})
+
+        n = body.get("n", 1)
+        texts = [self._text(body["messages"]) for _ in range(n)]
+        usage = {
+            "prompt_tokens": sum(len(m["content"]) for m in body["messages"]) // 4,
+            "completion_tokens": sum(len(t) for t in texts) // 4,
+        }
+        if body.get("stream"):
+            self.counts["streams"] += 1
+            return httpx.Response(200, stream=_SSEStream(texts[0], usage, self.chars_per_second), headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json={
+            "choices": [{"index": i, "message": {"role": "assistant", "content": t}} for i, t in enumerate(texts)],
+            "usage": usage,
+        })
+
+
+class _SSEStream(httpx.AsyncByteStream):
+    def __init__(self, text, usage, chars_per_second, chunk=40):
+        self.text = text
+        self.usage = usage
+        self.delay = chunk / chars_per_second
+        self.chunk = chunk
+
+    async def __aiter__(self):
+        for i in range(0, len(self.text), self.chunk):
+            await asyncio.sleep(self.delay)
+            data = {"choices": [{"index": 0, "delta": {"content": self.text[i:i + self.chunk]}}]}
+            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+        yield f"data: {json.dumps({'choices': [], 'usage': self.usage})}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+
+class _PhotoSize:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+
+class _Message:
+    def __init__(self, message_id, chat_id, photo=None):
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.photo = photo or []
+
+
+class FakeBot:
+    """Заменитель telegram.Bot: только send_message и send_photo."""
+
+    def __init__(self, latency=0.05, error_rate=0.0, retry_after_rate=0.0, retry_after=1, seed=None):
+        self.token = "100000:fake-token"
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.counts = collections.Counter()
+        self.sent = []
+        self._next_id = 0
+
+    async def _send(self, method, chat_id):
+        self.counts[method] += 1
+        await asyncio.sleep(self.latency)
+        roll = self.random.random()
+        if roll < self.retry_after_rate:
+            self.counts["retry_after"] += 1
+            raise RetryAfter(self.retry_after)
+        if roll < self.retry_after_rate + self.error_rate:
+            self.counts["errors"] += 1
+            raise TimedOut("fake timeout")
+        self._next_id += 1
+        return self._next_id
+
+    async def send_message(self, chat_id, text, **kwargs):
+        message_id = await self._send("send_message", chat_id)
+        self.sent.append((chat_id, "message", text))
+        return _Message(message_id, chat_id)
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        message_id = await self._send("send_photo", chat_id)
+        if isinstance(photo, str) and photo.startswith("fake-file-"):
+            file_id = photo
+        else:
+            self.counts["photo_uploads"] += 1
+            file_id = f"fake-file-{message_id}"
+        self.sent.append((chat_id, "photo", caption))
+        return _Message(message_id, chat_id, [_PhotoSize(file_id + "-small"), _PhotoSize(file_id)])
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, rows, cols, sheet_id):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.row_count = rows
+        self.col_count = cols
+        self.id = sheet_id
+        self.cells = {}
+
+    def _call(self, name):
+        self.spreadsheet._call(name)
+
+    def _set(self, cell_range, values):
+        cell_range = cell_range.split("!")[-1]
+        row, col = a1_to_rowcol(cell_range.split(":")[0])
+        for i, values_row in enumerate(values):
+            for j, value in enumerate(values_row):
+                self.cells[(row + i, col + j)] = value
+
+    def values(self):
+        if not self.cells:
+            return []
+        rows = max(r for r, _ in self.cells)
+        cols = max(c for _, c in self.cells)
+        return [[self.cells.get((r, c), "") for c in range(1, cols + 1)] for r in range(1, rows + 1)]
+
+    def get_all_values(self):
+        self._call("get_all_values")
+        return self.values()
+
+    def batch_update(self, data, **kwargs):
+        self._call("values_batch_update")
+        for item in data:
+            self._set(item["range"], item["values"])
+
+    def update(self, cell_range, values):
+        self._call("update")
+        self._set(cell_range, values)
+
+    def resize(self, rows=None, cols=None):
+        self._call("resize")
+        self.row_count = rows or self.row_count
+        self.col_count = cols or self.col_count
+
+    def add_cols(self, cols):
+        self._call("add_cols")
+        self.col_count += cols
+
+
+class FakeSpreadsheet:
+    """Заменитель gspread.Spreadsheet, который считает обращения к API."""
+
+    def __init__(self, latency=0.2, error_rate=0.0, seed=None, spreadsheet_id="fake-spreadsheet"):
+        self.id = spreadsheet_id
+        self.client = None
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.counts = collections.Counter()
+        self.worksheets_by_title = {}
+        self.modified = 0
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        # gspread вызывается из потоков (asyncio.to_thread), поэтому блокирующий sleep
+        with self._lock:
+            self.counts[name] += 1
+            failed = self.random.random() < self.error_rate
+        time.sleep(self.latency)
+        if failed:
+            raise gspread.exceptions.GSpreadException(f"fake Sheets error in {name}")
+        if name not in ("get_all_values", "values_batch_get", "worksheet", "worksheets", "get_lastUpdateTime"):
+            self.modified += 1
+
+    def add_month(self, title, topics, published=0):
+        worksheet = FakeWorksheet(self, title, len(topics) + 1, 4, len(self.worksheets_by_title) + 1)
+        worksheet._set("A1:D1", [["Номер поста", "Тема", "Статус", "Каналы"]])
+        rows = [[str(i), topic, "Опубликовано" if i <= published else ""] for i, topic in enumerate(topics, start=1)]
+        if rows:
+            worksheet._set(f"A2:C{len(rows) + 1}", rows)
+        self.worksheets_by_title[title] = worksheet
+        return worksheet
+
+    def worksheet(self, title):
+        self._call("worksheet")
+        if title not in self.worksheets_by_title:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.worksheets_by_title[title]
+
+    def worksheets(self):
+        self._call("worksheets")
+        return list(self.worksheets_by_title.values())
+
+    def add_worksheet(self, title, rows, cols):
+        self._call("add_worksheet")
+        worksheet = FakeWorksheet(self, title, int(rows), int(cols), len(self.worksheets_by_title) + 1)
+        self.worksheets_by_title[title] = worksheet
+        return worksheet
+
+    def values_batch_get(self, ranges, params=None):
+        self._call("values_batch_get")
+        value_ranges = []
+        for cell_range in ranges:
+            title = cell_range.split("!")[0].strip("'")
+            worksheet = self.worksheets_by_title.get(title)
+            value_ranges.append({"range": cell_range, "values": worksheet.values() if worksheet else []})
+        return {"valueRanges": value_ranges}
+
+    def batch_update(self, body):
+        # Сюда приходит форматирование из gspread_formatting
+        self._call("batch_update")
+        return {"replies": [{} for _ in body.get("requests", [])]}
+
+    def get_lastUpdateTime(self):
+        self._call("get_lastUpdateTime")
+        return str(self.modified)
+
+    @property
+    def api_calls(self):
+        return sum(self.counts.values())
@@ -0,0 +1,220 @@
+import asyncio
+import functools
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('post_bot.coordination')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS done (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    done_at REAL NOT NULL
+);
+"""
+
+LEADER = "leader"
+DONE_RETENTION_SECONDS = 120 * 86400
+
+
+class Coordinator:
+    """Аренды (leases) в общем SQLite-файле для нескольких реплик бота на одном хосте или томе.
+
+    Аренда принадлежит одной реплике до expires_at; продлить её может только владелец,
+    забрать — любая реплика после истечения срока. Метка done ставится на работу,
+    которая начата и не должна повторяться другими репликами.
+    """
+
+    def __init__(self, path, owner=None):
+        self.path = path
+        self.owner = owner or default_replica_id()
+        # Соединение используется из потоков asyncio.to_thread, транзакции не должны перемешиваться
+        self._lock = threading.Lock()
+        # autocommit: транзакции открываются явно через BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("DELETE FROM done WHERE done_at < ?", (time.time() - DONE_RETENTION_SECONDS,))
+
+    def close(self):
+        self.conn.close()
+
+    def acquire(self, name, ttl, unless_done=False):
+        """Берёт или продлевает аренду name на ttl секунд.
+
+        False — аренда у другой реплики или (при unless_done) другая реплика уже отметила работу сделанной.
+        """
+        with self._lock:
+            now = time.time()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if unless_done:
+                    done = self.conn.execute("SELECT owner FROM done WHERE name = ?", (name,)).fetchone()
+                    if done is not None and done[0] != self.owner:
+                        self.conn.execute("COMMIT")
+                        return False
+                row = self.conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+                if row is not None and row[0] != self.owner and row[1] > now:
+                    self.conn.execute("COMMIT")
+                    return False
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                    (name, self.owner, now + ttl),
+                )
+                self.conn.execute("COMMIT")
+                return True
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def release(self, name, undo_done=False):
+        with self._lock:
+            if undo_done:
+                self.conn.execute("DELETE FROM done WHERE name = ? AND owner = ?", (name, self.owner))
+            self.conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+
+    def mark_done(self, name, ttl):
+        """Отмечает работу начатой и продлевает аренду на ttl секунд.
+
+        False — аренда истекла и её взяла другая реплика или та уже отметила работу:
+        выполнять её нельзя, иначе пост уйдёт дважды.
+        """
+        with self._lock:
+            now = time.time()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                done = self.conn.execute("SELECT owner FROM done WHERE name = ?", (name,)).fetchone()
+                lease = self.conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+                if (done is not None and done[0] != self.owner) or (
+                    lease is not None and lease[0] != self.owner and lease[1] > now
+                ):
+                    self.conn.execute("COMMIT")
+                    return False
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO done (name, owner, done_at) VALUES (?, ?, ?)",
+                    (name, self.owner, now),
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                    (name, self.owner, now + ttl),
+                )
+                self.conn.execute("COMMIT")
+                return True
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+
+def default_replica_id(state_path=None):
+    """Id реплики, постоянный между перезапусками: хост и путь к её локальному состоянию (plan.db).
+
+    По нему реплика после перезапуска узнаёт свои метки и дошлёт частично опубликованные посты.
+    В контейнерах, где имя хоста меняется при пересоздании, задайте COORD_REPLICA_ID явно.
+    """
+    return f"{socket.gethostname()}:{os.path.abspath(state_path or os.getcwd())}"
+
+
+_coordinator = None
+_settings = {"leader_ttl": 15.0, "row_ttl": 600.0}
+_state = {"leader": False}
+_leader_callbacks = []
+
+
+def init_coordination(path, replica_id=None, leader_ttl=None, row_ttl=None):
+    """Включает координацию реплик. Без вызова бот считает себя единственной репликой.
+
+    Постоянный replica_id позволяет реплике после перезапуска продолжить свои начатые посты.
+    """
+    global _coordinator
+    if leader_ttl is not None:
+        _settings["leader_ttl"] = leader_ttl
+    if row_ttl is not None:
+        _settings["row_ttl"] = row_ttl
+    _coordinator = Coordinator(path, replica_id)
+    logger.info(f"Координация реплик через {path}, id реплики {_coordinator.owner}.")
+    return _coordinator
+
+
+def enabled():
+    return _coordinator is not None
+
+
+def is_leader():
+    return _coordinator is None or _state["leader"]
+
+
+def on_leader(callback):
+    """callback() вызывается (и может вернуть корутину), когда реплика становится ведущей."""
+    _leader_callbacks.append(callback)
+
+
+async def heartbeat():
+    """Берёт или продлевает аренду ведущей реплики; вызывается чаще, чем истекает leader_ttl."""
+    if _coordinator is None:
+        return True
+    try:
+        leader = await asyncio.to_thread(_coordinator.acquire, LEADER, _settings["leader_ttl"])
+    except sqlite3.Error as e:
+        # Не смогли продлить — считаем, что лидерство потеряно, чтобы не работать вдвоём
+        logger.error(f"Ошибка продления аренды ведущей реплики: {e}")
+        leader = False
+    was_leader, _state["leader"] = _state["leader"], leader
+    if leader and not was_leader:
+        logger.info("Реплика стала ведущей.")
+        for callback in _leader_callbacks:
+            result = callback()
+            if asyncio.iscoroutine(result):
+                asyncio.create_task(result)
+    elif was_leader and not leader:
+        logger.warning("Реплика больше не ведущая, плановые задачи приостановлены.")
+    return leader
+
+
+def leader_only(func):
+    # Плановая задача выполняется только на ведущей реплике
+    @functools.wraps(func)
+    async def run(*args):
+        if not is_leader():
+            logger.debug(f"Задача {func.__name__} пропущена: реплика не ведущая.")
+            return None
+        return await func(*args)
+    return run
+
+
+def _row(spreadsheet_id, month, post_number):
+    return f"post:{spreadsheet_id}:{month}:{post_number}"
+
+
+async def claim_post(spreadsheet_id, month, post_number):
+    """Аренда строки плана. False — пост публикует или уже начала публиковать другая реплика."""
+    if _coordinator is None:
+        return True
+    name = _row(spreadsheet_id, month, post_number)
+    return await asyncio.to_thread(_coordinator.acquire, name, _settings["row_ttl"], True)
+
+
+async def start_post(spreadsheet_id, month, post_number):
+    """Ставится до отправки: если реплика упадёт посреди рассылки, другие пост не повторят.
+
+    False — пока пост ждал очереди, аренда истекла и строку взяла другая реплика; отправлять нельзя.
+    """
+    if _coordinator is None:
+        return True
+    name = _row(spreadsheet_id, month, post_number)
+    return await asyncio.to_thread(_coordinator.mark_done, name, _settings["row_ttl"])
+
+
+async def release_post(spreadsheet_id, month, post_number, sent=True):
+    """Снимает аренду; при sent=False снимает и метку, чтобы пост могла отправить любая реплика."""
+    if _coordinator is None:
+        return
+    await asyncio.to_thread(_coordinator.release, _row(spreadsheet_id, month, post_number), not sent)
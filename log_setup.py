@@ -0,0 +1,136 @@
+import contextvars
+import json
+import logging
+import queue
+import time
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import colorlog
+
+import metrics
+import tenants
+
+# Поля, которые попадают в JSON отдельными ключами; передаются через extra={...}
+FIELDS = ("tenant", "job_id", "post_number", "month", "chat_id", "model", "latency")
+
+_job_id = contextvars.ContextVar("job_id", default=None)
+
+
+@contextmanager
+def job_context(job_id):
+    """Все записи лога внутри задачи (и запущенных из неё task) получают job_id."""
+    token = _job_id.set(job_id)
+    try:
+        yield
+    finally:
+        _job_id.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    # Работает в потоке вызова: contextvars фоновому потоку не видны
+    def filter(self, record):
+        if not hasattr(record, "tenant"):
+            record.tenant = tenants.current_id()
+        if not hasattr(record, "job_id"):
+            record.job_id = _job_id.get()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Пропускает не больше burst DEBUG-записей за interval секунд с одной строки кода."""
+
+    def __init__(self, burst=20, interval=60.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.windows = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or not self.burst:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        started, count = self.windows.get(key, (now, 0))
+        if now - started >= self.interval:
+            started, count = now, 0
+        count += 1
+        self.windows[key] = (started, count)
+        if count > self.burst:
+            metrics.inc("log_records_dropped_total", logger=record.name)
+            return False
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # В очередь уходит готовый текст сообщения, трассировка форматируется уже в фоновом потоке
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON без ANSI-цветов."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "source": f"{record.filename}:{record.lineno}",
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level="DEBUG", log_file="bot.log", max_bytes=5 * 1024 * 1024, backup_count=5,
+                  debug_burst=20, debug_interval=60.0):
+    """Логи пишутся через очередь: в event loop только постановка записи в очередь,
+    форматирование, вывод в консоль и запись/ротация файла — в потоке QueueListener.
+
+    Возвращает запущенный listener; listener.stop() дописывает оставшиеся записи.
+    """
+    console = colorlog.StreamHandler()
+    console.setFormatter(
+        colorlog.ColoredFormatter(
+            "%(log_color)s%(asctime)s - %(name)s - %(levelname)s - %(message)s [%(filename)s:%(lineno)d]",
+            log_colors={
+                'DEBUG': 'cyan',
+                'INFO': 'green',
+                'WARNING': 'yellow',
+                'ERROR': 'red',
+                'CRITICAL': 'bold_red',
+            }
+        )
+    )
+    handlers = [console]
+    if log_file:
+        file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(DebugSampler(debug_burst, debug_interval))
+
+    # Уровень задаётся логгеру: отсеянные записи не создаются и не попадают в очередь
+    logger = logging.getLogger('post_bot')
+    logger.setLevel(level)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
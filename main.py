@@ -1,60 +1,46 @@
 import asyncio
 import json
 import logging
-import openai
-from scheduler import schedule_tasks
-from telegram import Bot
+import coordination
+import openai_client
+import media_cache
+import promo_pool
+import log_setup
+import metrics
+import prompts
+import resilience
+import tenants
+import token_budget
+from scheduler import (
+    schedule_tasks,
+    schedule_sync,
+    schedule_pregen,
+    schedule_metrics_dump,
+    schedule_heartbeat,
+    instrument_scheduler
+)
 from sheets_client import (
     ensure_month_sheet,
     publish_unpublished_posts,
-    get_gsheet_client
+    open_spreadsheet,
+    reconcile_months,
+    sync_plan,
+    pregenerate_posts
 )
+from plan_store import init_store, get_store
+from publish_journal import init_journal
 from openai_client import generate_post
-from telegram_client import send_second_post
+from telegram_client import fan_out_second_post, configure_rate_limiter, get_bot
 import datetime
 import pytz
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from dotenv import load_dotenv
 import os
-import colorlog
-from logging.handlers import RotatingFileHandler
 import calendar
 
 load_dotenv()
 
-handler = colorlog.StreamHandler()
-handler.setFormatter(
-    colorlog.ColoredFormatter(
-        "%(log_color)s%(asctime)s - %(name)s - %(levelname)s - %(message)s [%(filename)s:%(lineno)d]",
-        log_colors={
-            'DEBUG': 'cyan',
-            'INFO': 'green',
-            'WARNING': 'yellow',
-            'ERROR': 'red',
-            'CRITICAL': 'bold_red',
-        }
-    )
-)
-
-logger = colorlog.getLogger('post_bot')
-logger.setLevel(logging.DEBUG)
-logger.addHandler(handler)
-
-file_handler = RotatingFileHandler("bot.log", maxBytes=5 * 1024 * 1024, backupCount=5)
-file_handler.setFormatter(
-    colorlog.ColoredFormatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s [%(filename)s:%(lineno)d]",
-        log_colors={
-            'DEBUG': 'cyan',
-            'INFO': 'green',
-            'WARNING': 'yellow',
-            'ERROR': 'red',
-            'CRITICAL': 'bold_red',
-        }
-    )
-)
-file_handler.setLevel(logging.DEBUG)
-logger.addHandler(file_handler)
+logger = logging.getLogger('post_bot')
 
 async def publish_daily_post(sheet, config, bot):
     logger.debug("Ежедневная публикация основного поста.")
@@ -77,30 +63,19 @@ async def publish_daily_post(sheet, config, bot):
 
 async def publish_second_post(bot, config):
     logger.debug("Публикация дополнительного поста.")
-    # Изменённые тексты для второго поста:
-    second_text = await generate_post(
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "Ты — супер-маркетолог по продажам запчастей для спецтехники. Пиши ярко, убедительно и объемно (около 1500-2000 символов). "
-                    "Призывай к общению в чат-боте, к заявкам, упоминай скидки и акции, используй смайлы, чтобы мотивировать читателя."
-                )
-            },
-            {
-                "role": "user",
-                "content": (
-                    "Напиши привлекательный, продающий пост для продаж запчастей для спецтехники. Мотивируй читателя оставить заявку в чат-боте, "
-                    "предложи акции, скидки, общение, используй смайлы и сделай текст максимально заманчивым."
-                )
-            },
-        ],
-        model=config["model_second"],
-        max_tokens=600,
-        temperature=0.7,
-        max_len=config["second_post_max_len"],
-    )
-    await send_second_post(bot, config["chat_id"], config["image_url"], second_text, config["bot_username"])
+    second_text = promo_pool.take_variant(config)
+    if second_text is None:
+        logger.info("Пул промо-постов пуст, генерируем текст сразу.")
+        second_text = await generate_post(
+            messages=promo_pool.promo_messages(config),
+            model=config["model_second"],
+            max_tokens=token_budget.max_tokens_for(config["second_post_max_len"]),
+            temperature=0.7,
+            max_len=config["second_post_max_len"],
+            stream=True,
+        )
+    image = media_cache.next_image(config["image_urls"])
+    await fan_out_second_post(bot, config["channels"], image, second_text)
 
 async def initial_check(sheet, config, bot):
     now = datetime.datetime.now(pytz.timezone(config["timezone"]))
@@ -111,20 +86,37 @@ async def initial_check(sheet, config, bot):
         prev_month = 12
         prev_year -= 1
 
+    months = [f"{prev_year}-{prev_month:02d}", f"{year}-{month:02d}"]
+    store = get_store()
+    try:
+        if all(store.has_month(sheet.id, m_name) for m_name in months):
+            # Перезапуск: зеркало и журнал уже есть, листы читаются, только если таблицу меняли
+            await sync_plan(sheet)
+        else:
+            # Оба месяца читаются одним batch_get, дальше всё считается по локальному зеркалу
+            await reconcile_months(sheet, months)
+    except Exception as e:
+        logger.error(f"Ошибка сверки с таблицей при запуске: {e}", exc_info=True)
+
     await ensure_month_sheet(sheet, prev_year, prev_month, config)
     prev_days = calendar.monthrange(prev_year, prev_month)[1]
     await publish_unpublished_posts(sheet, prev_year, prev_month, prev_days, config, bot)
 
     await ensure_month_sheet(sheet, year, month, config)
-    nine_am_today = now.replace(hour=9, minute=0, second=0, microsecond=0)
-    if now > nine_am_today:
+    post_time_today = now.replace(hour=config["daily_post_hour"], minute=config["daily_post_minute"], second=0, microsecond=0)
+    if now > post_time_today:
         await publish_unpublished_posts(sheet, year, month, day, config, bot)
     else:
         if day > 1:
             await publish_unpublished_posts(sheet, year, month, day - 1, config, bot)
 
-async def main():
-    logger.debug("Запуск бота.")
+async def run_initial_check(sheet, config, bot):
+    try:
+        await initial_check(sheet, config, bot)
+    except Exception as e:
+        logger.error(f"Ошибка догоняющей публикации при запуске: {e}", exc_info=True)
+
+def load_config():
     config = {
         "telegram_token": os.getenv("TELEGRAM_TOKEN"),
         "chat_id": os.getenv("CHAT_ID"),
@@ -137,24 +129,172 @@ async def main():
         "main_post_max_len": int(os.getenv("MAIN_POST_MAX_LEN", 4096)),
         "second_post_max_len": int(os.getenv("SECOND_POST_MAX_LEN", 1024)),
         "timezone": os.getenv("TIMEZONE", "Europe/Moscow"),
+        "tenant_id": tenants.DEFAULT_TENANT,
+        "company_name": os.getenv("COMPANY_NAME", prompts.DEFAULT_COMPANY),
+        "credentials_path": os.getenv("GOOGLE_CREDENTIALS", "credentials.json"),
     }
 
+    # Список каналов: [{"chat_id": ..., "bot_username": ..., "button_url": ...}], по умолчанию — один CHAT_ID
+    config["channels"] = json.loads(os.getenv("CHANNELS", "null")) or [
+        {"chat_id": config["chat_id"], "bot_username": config["bot_username"]}
+    ]
+
+    # Ротация изображений для второго поста: IMAGE_URLS (JSON-список URL или путей к файлам) или один IMAGE_URL
+    config["image_urls"] = json.loads(os.getenv("IMAGE_URLS", "null")) or [config["image_url"]]
+
     config["daily_post_hour"] = int(os.getenv("DAILY_POST_HOUR", 9))
     config["daily_post_minute"] = int(os.getenv("DAILY_POST_MINUTE", 0))
     config["second_post_times"] = json.loads(os.getenv("SECOND_POST_TIMES", '[{"hour":12,"minute":0},{"hour":15,"minute":0},{"hour":18,"minute":0}]'))
+    config["plan_db_path"] = os.getenv("PLAN_DB_PATH", "plan.db")
+    config["journal_path"] = os.getenv("PUBLISH_JOURNAL", "publish.journal")
+    # Координация нескольких реплик через общий SQLite-файл; без COORD_DB бот работает один
+    config["coord_db_path"] = os.getenv("COORD_DB")
+    # По умолчанию — хост и путь к plan.db; в контейнерах с меняющимся именем хоста задайте явно
+    config["coord_replica_id"] = os.getenv("COORD_REPLICA_ID")
+    config["coord_lease_seconds"] = float(os.getenv("COORD_LEASE_SECONDS", 15))
+    config["coord_heartbeat_seconds"] = float(os.getenv("COORD_HEARTBEAT_SECONDS", 5))
+    config["coord_row_lease_seconds"] = float(os.getenv("COORD_ROW_LEASE_SECONDS", 600))
+    config["sheets_sync_interval"] = int(os.getenv("SHEETS_SYNC_INTERVAL", 10))
+    config["pregen_hour"] = int(os.getenv("PREGEN_HOUR", 3))
+    config["pregen_minute"] = int(os.getenv("PREGEN_MINUTE", 0))
+    config["pregen_days_ahead"] = int(os.getenv("PREGEN_DAYS_AHEAD", 3))
+    config["pregen_max_age_hours"] = int(os.getenv("PREGEN_MAX_AGE_HOURS", 72))
+    config["catchup_concurrency"] = int(os.getenv("CATCHUP_CONCURRENCY", 4))
+    config["openai_base_url"] = os.getenv("OPENAI_BASE_URL", openai_client.DEFAULT_BASE_URL)
+    config["openai_timeout"] = float(os.getenv("OPENAI_TIMEOUT", 120))
+    config["openai_connect_timeout"] = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 10))
+    config["openai_max_connections"] = int(os.getenv("OPENAI_MAX_CONNECTIONS", 10))
+    config["promo_pool_size"] = int(os.getenv("PROMO_POOL_SIZE", 6))
+    config["promo_pool_low_water"] = int(os.getenv("PROMO_POOL_LOW_WATER", 2))
+    config["promo_batch_size"] = int(os.getenv("PROMO_BATCH_SIZE", 3))
+    config["promo_max_daily_calls"] = int(os.getenv("PROMO_MAX_DAILY_CALLS", 3))
+    config["promo_similarity"] = float(os.getenv("PROMO_SIMILARITY", 0.6))
+    config["metrics_port"] = int(os.getenv("METRICS_PORT", 0))
+    config["metrics_json_path"] = os.getenv("METRICS_JSON_PATH")
+    config["metrics_json_interval"] = int(os.getenv("METRICS_JSON_INTERVAL", 60))
+    config["telegram_global_rate"] = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))
+    config["telegram_chat_rate"] = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+    config["telegram_group_per_minute"] = int(os.getenv("TELEGRAM_GROUP_PER_MINUTE", 20))
+    config["topic_horizon_days"] = int(os.getenv("TOPIC_HORIZON_DAYS", 365))
+    config["topic_batch_size"] = int(os.getenv("TOPIC_BATCH_SIZE", 50))
+    config["topic_extra_calls"] = int(os.getenv("TOPIC_EXTRA_CALLS", 3))
+    config["topic_similarity"] = float(os.getenv("TOPIC_SIMILARITY", 0.6))
+    # Файл клиентов (JSON-список); без него работает один клиент из переменных окружения
+    config["tenants_file"] = os.getenv("TENANTS_FILE")
+    # Дневная квота запросов к OpenAI на клиента, 0 — без лимита
+    config["openai_daily_calls"] = int(os.getenv("OPENAI_DAILY_CALLS", 0))
+    # Бюджет токенов на клиента (0 — без лимита). С доли TOKEN_BUDGET_SOFT запросы идут
+    # на запасные модели с урезанным max_tokens, а пополнение промо-пула откладывается
+    config["token_budget_daily"] = int(os.getenv("TOKEN_BUDGET_DAILY", 0))
+    config["token_budget_monthly"] = int(os.getenv("TOKEN_BUDGET_MONTHLY", 0))
+    config["token_budget_soft"] = float(os.getenv("TOKEN_BUDGET_SOFT", 0.8))
+    config["token_budget_trim"] = float(os.getenv("TOKEN_BUDGET_TRIM", 0.75))
+    config["model_main_fallback"] = os.getenv("MODEL_MAIN_FALLBACK")
+    config["model_second_fallback"] = os.getenv("MODEL_SECOND_FALLBACK")
+    config["log_level"] = os.getenv("LOG_LEVEL", "DEBUG").upper()
+    config["log_file"] = os.getenv("LOG_FILE", "bot.log")
+    # Не больше LOG_DEBUG_BURST DEBUG-записей с одной строки кода за LOG_DEBUG_INTERVAL сек.
+    config["log_debug_burst"] = int(os.getenv("LOG_DEBUG_BURST", 20))
+    config["log_debug_interval"] = float(os.getenv("LOG_DEBUG_INTERVAL", 60))
+    config["retry_max_attempts"] = int(os.getenv("RETRY_MAX_ATTEMPTS", 3))
+    config["retry_base_delay"] = float(os.getenv("RETRY_BASE_DELAY", 2))
+    config["retry_max_delay"] = float(os.getenv("RETRY_MAX_DELAY", 60))
+    config["breaker_failures"] = int(os.getenv("BREAKER_FAILURES", 5))
+    config["breaker_reset_seconds"] = float(os.getenv("BREAKER_RESET_SECONDS", 120))
+    return config
 
-    openai.api_key = config["openai_api_key"]
+async def main(config=None):
+    logger.debug("Запуск бота.")
+    config = config or load_config()
+
+    configure_rate_limiter(
+        config["telegram_global_rate"],
+        config["telegram_chat_rate"],
+        config["telegram_group_per_minute"],
+    )
+    openai_client.configure(
+        config["openai_api_key"],
+        base_url=config["openai_base_url"],
+        timeout=config["openai_timeout"],
+        connect_timeout=config["openai_connect_timeout"],
+        max_connections=config["openai_max_connections"],
+    )
+    resilience.configure(
+        max_attempts=config["retry_max_attempts"],
+        base_delay=config["retry_base_delay"],
+        max_delay=config["retry_max_delay"],
+        failure_threshold=config["breaker_failures"],
+        reset_timeout=config["breaker_reset_seconds"],
+    )
 
     try:
-        sheet = await get_gsheet_client("credentials.json", config["spreadsheet_id"])
-        bot = Bot(token=config["telegram_token"])
+        store = init_store(config["plan_db_path"])
+        # Доставки, записанные в журнал до остановки, переносятся в plan.db до первой публикации
+        init_journal(config["journal_path"]).replay(store)
+        if config["coord_db_path"]:
+            coordination.init_coordination(
+                config["coord_db_path"],
+                replica_id=config["coord_replica_id"] or coordination.default_replica_id(config["plan_db_path"]),
+                leader_ttl=config["coord_lease_seconds"],
+                row_ttl=config["coord_row_lease_seconds"],
+            )
+            await coordination.heartbeat()
+        tenant_configs = tenants.load_tenants(config, config["tenants_file"])
     except Exception as e:
-        logger.error(f"Ошибка инициализации клиентов: {e}", exc_info=True)
+        logger.error(f"Ошибка инициализации: {e}", exc_info=True)
         return
 
-    await initial_check(sheet, config, bot)
-
+    # Один планировщик на все клиенты; часовой пояс задаётся в каждой задаче
     scheduler = AsyncIOScheduler(timezone=config["timezone"])
+    instrument_scheduler(scheduler)
+    started = []
+    for tenant in tenant_configs:
+        # Ошибка одного клиента (таблица, токен) не мешает запуску остальных
+        try:
+            sheet, bot = await start_tenant(scheduler, tenant)
+        except Exception as e:
+            logger.error(f"Клиент {tenant['tenant_id']} не запущен: {e}", exc_info=True)
+            continue
+        started.append((tenant, sheet, bot))
+    if not started:
+        logger.error("Не удалось запустить ни одного клиента.")
+        return
+
+    if coordination.enabled():
+        await schedule_heartbeat(scheduler, config["coord_heartbeat_seconds"], coordination.heartbeat)
+    if config["metrics_json_path"]:
+        await schedule_metrics_dump(scheduler, config["metrics_json_interval"], metrics.write_json, config["metrics_json_path"])
+    metrics_server = None
+    if config["metrics_port"]:
+        metrics_server = await metrics.start_http_server(config["metrics_port"])
+    scheduler.start()
+    # Планировщик уже работает, пропущенные посты догоняем в фоне.
+    # Догоняют все реплики: строки делятся между ними через аренды.
+    catch_ups = start_catch_up(started, refill=coordination.is_leader())
+    # Резервная реплика, ставшая ведущей, догоняет слоты, пропущенные прежней
+    coordination.on_leader(lambda: catch_ups.extend(start_catch_up(started, refill=True)))
+    logger.info(f"Бот запущен и работает, клиентов: {len(started)}.")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+            await metrics_server.wait_closed()
+
+def start_catch_up(started, refill=True):
+    # refill — пополнение запаса промо-постов, его ведёт только ведущая реплика
+    tasks = []
+    for tenant, sheet, bot in started:
+        with tenants.use(tenant):
+            tasks.append(asyncio.create_task(run_initial_check(sheet, tenant, bot)))
+            if refill:
+                promo_pool.start_refill(tenant)
+    return tasks
+
+async def start_tenant(scheduler, config):
+    # При недоступном Google Sheets клиент всё равно запускается и публикует по локальному зеркалу
+    sheet = await open_spreadsheet(config["credentials_path"], config["spreadsheet_id"])
+    bot = get_bot(config["telegram_token"])
     await schedule_tasks(
         scheduler,
         config["daily_post_hour"],
@@ -164,9 +304,19 @@ async def main():
         publish_second_post,
         sheet, config, bot
     )
-    scheduler.start()
-    logger.info("Бот запущен и работает.")
-    await asyncio.Event().wait()
+    await schedule_sync(scheduler, config["sheets_sync_interval"], sync_plan, sheet, config)
+    await schedule_pregen(scheduler, config["pregen_hour"], config["pregen_minute"], pregenerate_posts, sheet, config)
+    return sheet, bot
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    config = load_config()
+    log_listener = log_setup.setup_logging(
+        config["log_level"],
+        config["log_file"],
+        debug_burst=config["log_debug_burst"],
+        debug_interval=config["log_debug_interval"],
+    )
+    try:
+        asyncio.run(main(config))
+    finally:
+        log_listener.stop()
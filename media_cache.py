@@ -0,0 +1,100 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+import httpx
+
+from plan_store import get_store
+
+logger = logging.getLogger('post_bot.media_cache')
+
+REVALIDATE_SECONDS = 6 * 3600  # как часто проверять, не поменялся ли исходный файл
+
+_http = None
+
+
+def _http_client():
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(timeout=httpx.Timeout(10.0), follow_redirects=True)
+    return _http
+
+
+async def _fingerprint(source):
+    """Отпечаток источника: размер и mtime файла или ETag/Last-Modified URL.
+
+    None — проверить не удалось; в этом случае кэш не сбрасываем.
+    """
+    if os.path.isfile(source):
+        st = os.stat(source)
+        return f"{st.st_size}:{int(st.st_mtime)}"
+    try:
+        response = await _http_client().head(source)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.warning(f"Не удалось проверить изображение {source}: {e}")
+        return None
+    headers = response.headers
+    return headers.get("etag") or headers.get("last-modified") or headers.get("content-length") or ""
+
+
+async def upload_payload(source):
+    # Локальный файл отдаём содержимым, URL — строкой (Telegram скачает сам).
+    # Файл читается в отдельном потоке, чтобы не задерживать рассылку.
+    if os.path.isfile(source):
+        return await asyncio.to_thread(_read_file, source)
+    return source
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _bot_id(bot):
+    # file_id действителен только для бота, который его получил
+    return bot.token.split(":")[0]
+
+
+async def resolve(bot, source, revalidate_seconds=REVALIDATE_SECONDS):
+    """Возвращает (file_id или None, отпечаток источника)."""
+    store = get_store()
+    entry = store.get_media(_bot_id(bot), source)
+    if entry is not None:
+        fingerprint, file_id, checked_at = entry
+        # Локальный файл проверяется дёшево, поэтому каждый раз; URL — не чаще revalidate_seconds
+        if not os.path.isfile(source) and time.time() - checked_at < revalidate_seconds:
+            return file_id, fingerprint
+        current = await _fingerprint(source)
+        if current is None or not fingerprint or current == fingerprint:
+            store.save_media(_bot_id(bot), source, current or fingerprint, file_id)
+            return file_id, fingerprint
+        logger.info(f"Изображение {source} изменилось, file_id сброшен.")
+        store.delete_media(_bot_id(bot), source)
+        return None, current
+    return None, await _fingerprint(source)
+
+
+def remember(bot, source, fingerprint, message):
+    if message is None or not message.photo:
+        return
+    file_id = message.photo[-1].file_id
+    get_store().save_media(_bot_id(bot), source, fingerprint or "", file_id)
+    logger.debug(f"Сохранён file_id для {source}.")
+
+
+def forget(bot, source):
+    get_store().delete_media(_bot_id(bot), source)
+
+
+def next_image(sources):
+    """Следующее изображение из ротации; позиция хранится между перезапусками."""
+    if len(sources) == 1:
+        return sources[0]
+    key = "image_rotation:" + hashlib.sha1("\n".join(sources).encode()).hexdigest()
+    store = get_store()
+    index = int(store.get_value(key) or 0)
+    store.set_value(key, str((index + 1) % len(sources)))
+    return sources[index % len(sources)]
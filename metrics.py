@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('post_bot.metrics')
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HELP = {
+    "openai_request_seconds": "Длительность запросов к OpenAI",
+    "openai_retries_total": "Повторные попытки запросов к OpenAI",
+    "openai_failures_total": "Запросы к OpenAI, завершившиеся ошибкой после всех попыток",
+    "openai_prompt_tokens_total": "Токены промпта по моделям",
+    "openai_completion_tokens_total": "Токены ответа по моделям",
+    "telegram_send_seconds": "Длительность отправок в Telegram",
+    "telegram_flood_control_total": "Срабатывания flood control (RetryAfter)",
+    "telegram_retries_total": "Повторные попытки отправки в Telegram",
+    "telegram_failures_total": "Отправки в Telegram, завершившиеся ошибкой после всех попыток",
+    "sheets_request_seconds": "Длительность вызовов Google Sheets API",
+    "sheets_failures_total": "Ошибки вызовов Google Sheets API",
+    "scheduler_job_lag_seconds": "Задержка старта задачи относительно времени по расписанию",
+    "log_records_dropped_total": "DEBUG-записи лога, отброшенные ограничителем частоты",
+}
+
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name):
+        self.name = name
+        self.values = {}
+
+    def inc(self, value=1, **labels):
+        key = _key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, value
+
+    def snapshot(self):
+        return [{"labels": dict(key), "value": value} for key, value in self.values.items()]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, buckets=BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state["counts"][i] += 1
+        state["sum"] += value
+        state["count"] += 1
+
+    def samples(self):
+        for key, state in self.values.items():
+            for bound, count in zip(self.buckets, state["counts"]):
+                yield f"{self.name}_bucket", key + (("le", str(bound)),), count
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), state["count"]
+            yield f"{self.name}_sum", key, state["sum"]
+            yield f"{self.name}_count", key, state["count"]
+
+    def snapshot(self):
+        return [
+            {
+                "labels": dict(key),
+                "count": state["count"],
+                "sum": round(state["sum"], 4),
+                "buckets": dict(zip(map(str, self.buckets), state["counts"])),
+            }
+            for key, state in self.values.items()
+        ]
+
+
+_metrics = {}
+
+
+def _get(name, cls):
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = _metrics[name] = cls(name)
+    return metric
+
+
+def inc(name, value=1, **labels):
+    _get(name, Counter).inc(value, **labels)
+
+
+def observe(name, value, **labels):
+    _get(name, Histogram).observe(value, **labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - start, **labels)
+
+
+def reset():
+    _metrics.clear()
+
+
+def render_prometheus():
+    lines = []
+    for name, metric in sorted(_metrics.items()):
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} {metric.type}")
+        for sample_name, key, value in metric.samples():
+            labels = ",".join(f'{k}="{v}"' for k, v in key)
+            lines.append(f"{sample_name}{{{labels}}} {value}" if labels else f"{sample_name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    return {
+        "generated_at": time.time(),
+        "metrics": {name: {"type": metric.type, "values": metric.snapshot()} for name, metric in _metrics.items()},
+    }
+
+
+async def write_json(path):
+    # Снимок берётся в event loop, где меняются метрики; в поток уходит только запись файла
+    data = json.dumps(snapshot(), ensure_ascii=False)
+    await asyncio.to_thread(_write_file, path, data)
+
+
+def _write_file(path, data):
+    # Пишем во временный файл и переименовываем, чтобы читатель не увидел половину JSON
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+async def _handle(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render_prometheus().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Ошибка обработки запроса метрик: {e}")
+    finally:
+        writer.close()
+
+
+async def start_http_server(port, host="0.0.0.0"):
+    """Минимальный HTTP-эндпоинт /metrics в формате Prometheus в том же event loop."""
+    server = await asyncio.start_server(_handle, host, port)
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics.")
+    return server
@@ -1,43 +1,262 @@
-import openai
+import httpx
+import json
 import logging
 import asyncio
+import re
+import time
+import metrics
+import resilience
+import tenants
+import token_budget
 
-MAX_RETRIES = 3
-DELAY_RETRY = 5  # секунды между попытками
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
 
 logger = logging.getLogger('post_bot.openai_client')
 
-async def generate_post(messages, model, max_tokens, temperature=0.7, max_len=4096):
-    logger.debug(f"Запрос к OpenAI: модель={model}, max_tokens={max_tokens}, temperature={temperature}, max_len={max_len}")
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            response = await asyncio.to_thread(
-                openai.ChatCompletion.create,
+
+class OpenAIError(Exception):
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+class RateLimitError(OpenAIError):
+    pass
+
+
+_settings = {
+    "api_key": None,
+    "base_url": DEFAULT_BASE_URL,
+    "timeout": 120.0,
+    "connect_timeout": 10.0,
+    "max_connections": 10,
+    "transport": None,
+}
+_client = None
+
+
+def configure(api_key, base_url=None, timeout=None, connect_timeout=None, max_connections=None, transport=None):
+    """Задаёт параметры общего HTTP-клиента. Вызывается один раз при старте.
+
+    transport позволяет подменить сеть (например, httpx.MockTransport в бенчмарках).
+    """
+    global _client
+    _settings["api_key"] = api_key
+    _settings["transport"] = transport
+    if base_url:
+        _settings["base_url"] = base_url.rstrip("/")
+    if timeout is not None:
+        _settings["timeout"] = timeout
+    if connect_timeout is not None:
+        _settings["connect_timeout"] = connect_timeout
+    if max_connections is not None:
+        _settings["max_connections"] = max_connections
+    _client = None
+
+
+def get_client():
+    # Один пул соединений на весь процесс: keep-alive избавляет от TLS-рукопожатия на каждый запрос
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=_settings["base_url"],
+            headers={"Authorization": f"Bearer {_settings['api_key']}"},
+            timeout=httpx.Timeout(_settings["timeout"], connect=_settings["connect_timeout"]),
+            limits=httpx.Limits(
+                max_connections=_settings["max_connections"],
+                max_keepalive_connections=_settings["max_connections"],
+                keepalive_expiry=60.0,
+            ),
+            transport=_settings["transport"],
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _raise_for_error(response):
+    if response.status_code < 400:
+        return
+    try:
+        message = response.json()["error"]["message"]
+    except Exception:
+        message = response.text[:200]
+    retry_after = _retry_after_header(response.headers)
+    if response.status_code == 429:
+        raise RateLimitError(message, response.status_code, retry_after)
+    raise OpenAIError(f"HTTP {response.status_code}: {message}", response.status_code, retry_after)
+
+
+def _retry_after_header(headers):
+    # OpenAI отдаёт retry-after-ms и/или retry-after (в секундах)
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def _record_usage(model, usage):
+    if not usage:
+        return
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    metrics.inc("openai_prompt_tokens_total", prompt_tokens, model=model)
+    metrics.inc("openai_completion_tokens_total", completion_tokens, model=model)
+    token_budget.record(model, prompt_tokens, completion_tokens)
+
+
+async def chat_completion(**payload):
+    with metrics.timer("openai_request_seconds", model=payload["model"], stream="false"):
+        response = await get_client().post("/chat/completions", json=payload)
+        _raise_for_error(response)
+        data = response.json()
+    _record_usage(payload["model"], data.get("usage"))
+    return data
+
+
+async def stream_completion(max_len, **payload):
+    """Читает ответ потоком и обрывает запрос, как только набрано max_len символов."""
+    parts = []
+    length = 0
+    usage = None
+    # include_usage: последний чанк несёт счётчики токенов (если поток дочитан до конца)
+    body = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+    with metrics.timer("openai_request_seconds", model=payload["model"], stream="true"):
+        async with get_client().stream("POST", "/chat/completions", json=body) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                _raise_for_error(response)
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get("usage") or usage
+                choices = chunk.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content") or ""
+                parts.append(delta)
+                length += len(delta)
+                if length >= max_len:
+                    logger.debug(f"Достигнут лимит {max_len} символов, прерываем генерацию.")
+                    break
+    text = "".join(parts)
+    if usage is None:
+        # Поток оборван до чанка с usage: расход оцениваем по длине текста
+        prompt = "".join(m["content"] for m in payload["messages"])
+        usage = {
+            "prompt_tokens": token_budget.estimate_tokens(prompt),
+            "completion_tokens": token_budget.estimate_tokens(text),
+        }
+    _record_usage(payload["model"], usage)
+    return text
+
+
+_SENTENCE_END = re.compile(r'[.!?…](?=\s|$)')
+
+
+def trim_to_boundary(text, max_len):
+    """Обрезает текст до max_len по концу абзаца или предложения, а не посреди слова."""
+    if len(text) <= max_len:
+        return text
+    cut = text[:max_len]
+    paragraph = cut.rfind("\n\n")
+    if paragraph >= max_len * 0.6:
+        return cut[:paragraph].rstrip()
+    sentence_ends = [m.end() for m in _SENTENCE_END.finditer(cut)]
+    if sentence_ends and sentence_ends[-1] >= max_len * 0.5:
+        return cut[:sentence_ends[-1]].rstrip()
+    space = cut.rfind(" ")
+    if space > 0:
+        return cut[:space].rstrip()
+    return cut
+
+
+async def generate_post(messages, model, max_tokens, temperature=0.7, max_len=4096, stream=False, priority="normal"):
+    """priority="low" — запрос можно отложить при нехватке бюджета токенов (BudgetDeferred)."""
+    texts = await _generate(messages, model, max_tokens, temperature, max_len, stream=stream, priority=priority)
+    return texts[0]
+
+
+async def generate_variants(messages, model, max_tokens, n, temperature=0.9, max_len=4096, priority="normal"):
+    """Несколько вариантов текста одним запросом (параметр n)."""
+    return await _generate(messages, model, max_tokens, temperature, max_len, n=n, priority=priority)
+
+
+def _is_retryable(e):
+    if isinstance(e, OpenAIError):
+        return e.retryable
+    return isinstance(e, httpx.TransportError)
+
+
+async def _generate(messages, model, max_tokens, temperature, max_len, stream=False, n=1, priority="normal"):
+    model, max_tokens = token_budget.plan(model, max_tokens, priority)
+    tenants.charge_openai()
+    start = time.monotonic()
+    logger.debug(f"Запрос к OpenAI: модель={model}, max_tokens={max_tokens}, temperature={temperature}, max_len={max_len}, stream={stream}, n={n}")
+
+    async def attempt():
+        if stream:
+            texts = [await stream_completion(
+                max_len,
                 model=model,
                 messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
-            )
-            text = response.choices[0].message['content'].strip()
-            logger.debug(f"Ответ OpenAI: {text[:100]}...")
-            return text[:max_len]
-        
-        except openai.error.RateLimitError as e:
-            logger.warning(f"Лимит запросов OpenAI. Ждём {DELAY_RETRY} сек. Попытка {attempt}/{MAX_RETRIES}.")
-            await asyncio.sleep(DELAY_RETRY)
-        except openai.error.OpenAIError as e:
-            logger.error(f"OpenAI Error: {e}", exc_info=True)
-            if attempt < MAX_RETRIES:
-                logger.info(f"Повторная попытка через {DELAY_RETRY} секунд. Попытка {attempt+1}/{MAX_RETRIES}")
-                await asyncio.sleep(DELAY_RETRY)
-            else:
-                logger.critical(f"Превышено кол-во попыток. Ошибка: {e}")
-                raise
-        except Exception as e:
-            logger.error(f"Неизвестная ошибка: {e}", exc_info=True)
-            if attempt < MAX_RETRIES:
-                logger.info(f"Повтор через {DELAY_RETRY} сек. Попытка {attempt+1}/{MAX_RETRIES}")
-                await asyncio.sleep(DELAY_RETRY)
-            else:
-                logger.critical(f"Превышено кол-во попыток. Ошибка: {e}")
-                raise
+            )]
+        else:
+            payload = dict(model=model, messages=messages, max_tokens=max_tokens, temperature=temperature)
+            if n > 1:
+                payload["n"] = n
+            response = await chat_completion(**payload)
+            texts = [choice["message"]["content"] for choice in response["choices"]]
+        return [trim_to_boundary(text.strip(), max_len) for text in texts]
+
+    def on_retry(e, attempt_number, delay):
+        reason = "rate_limit" if isinstance(e, RateLimitError) else "api_error"
+        logger.warning(f"Ошибка OpenAI ({e}). Повтор через {delay:.1f} сек., попытка {attempt_number + 1}.")
+        metrics.inc("openai_retries_total", model=model, reason=reason)
+
+    try:
+        texts = await resilience.call_with_retry(
+            attempt,
+            name="openai",
+            breaker=resilience.get_breaker("openai"),
+            retry_on=(OpenAIError, httpx.TransportError),
+            should_retry=_is_retryable,
+            # Лимит запросов — не признак недоступности сервиса
+            is_failure=lambda e: not isinstance(e, RateLimitError),
+            retry_after=lambda e: getattr(e, "retry_after", None),
+            on_retry=on_retry,
+        )
+    except (OpenAIError, httpx.TransportError) as e:
+        if _is_retryable(e):
+            logger.critical(f"Превышено кол-во попыток. Ошибка: {e}")
+        else:
+            logger.error(f"OpenAI отклонил запрос: {e}")
+        metrics.inc("openai_failures_total", model=model)
+        raise
+    except (resilience.CircuitOpenError, resilience.DeadlineExceeded) as e:
+        logger.error(f"Запрос к OpenAI не выполнен: {e}")
+        metrics.inc("openai_failures_total", model=model)
+        raise
+    logger.debug(
+        f"Ответ OpenAI: {texts[0][:100]}...",
+        extra={"model": model, "latency": round(time.monotonic() - start, 3)},
+    )
+    return texts
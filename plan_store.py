@@ -0,0 +1,422 @@
+import sqlite3
+import logging
+import time
+
+logger = logging.getLogger('post_bot.plan_store')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    spreadsheet_id TEXT NOT NULL,
+    month TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    post_number INTEGER,
+    topic TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT '',
+    delivery TEXT,
+    revision INTEGER NOT NULL DEFAULT 0,
+    dirty INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (spreadsheet_id, month, row_index)
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    spreadsheet_id TEXT NOT NULL,
+    month TEXT NOT NULL,
+    post_number INTEGER NOT NULL,
+    chat_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    delivered_at REAL NOT NULL,
+    PRIMARY KEY (spreadsheet_id, month, post_number, chat_id)
+);
+CREATE TABLE IF NOT EXISTS months (
+    spreadsheet_id TEXT NOT NULL,
+    month TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (spreadsheet_id, month)
+);
+CREATE TABLE IF NOT EXISTS ready_posts (
+    spreadsheet_id TEXT NOT NULL,
+    month TEXT NOT NULL,
+    post_number INTEGER NOT NULL,
+    topic TEXT NOT NULL,
+    text TEXT NOT NULL,
+    generated_at REAL NOT NULL,
+    PRIMARY KEY (spreadsheet_id, month, post_number)
+);
+CREATE TABLE IF NOT EXISTS media (
+    bot_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (bot_id, source)
+);
+CREATE TABLE IF NOT EXISTS promo_variants (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pool TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL
+);
+CREATE TABLE IF NOT EXISTS planned_topics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    spreadsheet_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    month TEXT
+);
+CREATE TABLE IF NOT EXISTS token_usage (
+    day TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    model TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, tenant, model)
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS spreadsheets (
+    spreadsheet_id TEXT PRIMARY KEY,
+    modified_time TEXT
+);
+"""
+
+PUBLISHED = "опубликовано"
+
+
+class PlanStore:
+    """Локальное зеркало листов контент-плана в SQLite.
+
+    Бот читает темы и статусы отсюда. Изменения статусов помечаются dirty
+    и уходят в Google Sheets отложенно (write-behind), так что публикация
+    не ждёт таблицу и переживает её недоступность.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.conn.commit()
+        logger.debug(f"Открыто локальное зеркало контент-плана {path}.")
+
+    def _migrate(self):
+        columns = {r[1] for r in self.conn.execute("PRAGMA table_info(posts)")}
+        if "delivery" not in columns:
+            self.conn.execute("ALTER TABLE posts ADD COLUMN delivery TEXT")
+        # Кэш ответов OpenAI больше не используется: повторы покрывает ready_posts
+        self.conn.execute("DROP TABLE IF EXISTS llm_responses")
+
+    def close(self):
+        self.conn.close()
+
+    def has_month(self, spreadsheet_id, month):
+        row = self.conn.execute(
+            "SELECT 1 FROM months WHERE spreadsheet_id = ? AND month = ?",
+            (spreadsheet_id, month),
+        ).fetchone()
+        return row is not None
+
+    def months(self, spreadsheet_id):
+        rows = self.conn.execute(
+            "SELECT month FROM months WHERE spreadsheet_id = ? ORDER BY month",
+            (spreadsheet_id,),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def replace_month(self, spreadsheet_id, month, rows):
+        """Загружает снимок листа: rows — (row_index, post_number, topic, status).
+
+        Строки с неотправленными локальными изменениями (dirty) сохраняют свой
+        статус, чтобы чтение из таблицы не затёрло ещё не записанную публикацию.
+        """
+        with self.conn:
+            current = {
+                r[0]: r[1:]
+                for r in self.conn.execute(
+                    "SELECT row_index, post_number, topic, status, revision, dirty FROM posts "
+                    "WHERE spreadsheet_id = ? AND month = ?",
+                    (spreadsheet_id, month),
+                )
+            }
+            seen = set()
+            for row_index, post_number, topic, status in rows:
+                seen.add(row_index)
+                old = current.get(row_index)
+                if old is None:
+                    self.conn.execute(
+                        "INSERT INTO posts (spreadsheet_id, month, row_index, post_number, topic, status) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (spreadsheet_id, month, row_index, post_number, topic, status),
+                    )
+                    continue
+                old_number, old_topic, old_status, revision, dirty = old
+                if dirty:
+                    status = old_status
+                if (old_number, old_topic, old_status) != (post_number, topic, status):
+                    self.conn.execute(
+                        "UPDATE posts SET post_number = ?, topic = ?, status = ?, revision = ? "
+                        "WHERE spreadsheet_id = ? AND month = ? AND row_index = ?",
+                        (post_number, topic, status, revision + 1, spreadsheet_id, month, row_index),
+                    )
+            for row_index, old in current.items():
+                if row_index not in seen and not old[4]:
+                    self.conn.execute(
+                        "DELETE FROM posts WHERE spreadsheet_id = ? AND month = ? AND row_index = ?",
+                        (spreadsheet_id, month, row_index),
+                    )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO months (spreadsheet_id, month, synced_at) VALUES (?, ?, ?)",
+                (spreadsheet_id, month, time.time()),
+            )
+
+    def add_topics(self, spreadsheet_id, month, rows):
+        """Добавляет строки, уже записанные в таблицу: (row_index, post_number, topic)."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO posts (spreadsheet_id, month, row_index, post_number, topic, status) "
+                "VALUES (?, ?, ?, ?, ?, '')",
+                [(spreadsheet_id, month, r, n, t) for r, n, t in rows],
+            )
+            self.conn.execute(
+                "INSERT OR IGNORE INTO months (spreadsheet_id, month, synced_at) VALUES (?, ?, ?)",
+                (spreadsheet_id, month, time.time()),
+            )
+
+    def topic_count(self, spreadsheet_id, month):
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM posts WHERE spreadsheet_id = ? AND month = ? AND topic != ''",
+            (spreadsheet_id, month),
+        ).fetchone()
+        return row[0]
+
+    def unpublished(self, spreadsheet_id, month, up_to=None):
+        """Неопубликованные посты месяца: (row_index, post_number, topic) по номеру поста."""
+        rows = self.conn.execute(
+            "SELECT row_index, post_number, topic, status FROM posts "
+            "WHERE spreadsheet_id = ? AND month = ? AND topic != '' AND post_number IS NOT NULL "
+            "ORDER BY post_number",
+            (spreadsheet_id, month),
+        ).fetchall()
+        return [
+            (row_index, post_number, topic)
+            for row_index, post_number, topic, status in rows
+            if status.lower() != PUBLISHED and (up_to is None or post_number <= up_to)
+        ]
+
+    def mark_status(self, spreadsheet_id, month, row_index, status, delivery=None):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE posts SET status = ?, delivery = ?, revision = revision + 1, dirty = 1 "
+                "WHERE spreadsheet_id = ? AND month = ? AND row_index = ?",
+                (status, delivery, spreadsheet_id, month, row_index),
+            )
+
+    def pending(self, spreadsheet_id):
+        """Изменения, ещё не записанные в таблицу: (month, row_index, status, delivery, revision)."""
+        return self.conn.execute(
+            "SELECT month, row_index, status, delivery, revision FROM posts "
+            "WHERE spreadsheet_id = ? AND dirty = 1 ORDER BY month, row_index",
+            (spreadsheet_id,),
+        ).fetchall()
+
+    def clear_dirty(self, spreadsheet_id, items):
+        """Снимает флаг dirty, если строку не меняли после чтения pending()."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE posts SET dirty = 0 "
+                "WHERE spreadsheet_id = ? AND month = ? AND row_index = ? AND revision = ?",
+                [(spreadsheet_id, month, row_index, revision) for month, row_index, revision in items],
+            )
+
+    def record_delivery(self, spreadsheet_id, month, post_number, chat_id, message_id):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO deliveries (spreadsheet_id, month, post_number, chat_id, message_id, delivered_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (spreadsheet_id, month, post_number, str(chat_id), message_id, time.time()),
+            )
+
+    def delivered_chats(self, spreadsheet_id, month, post_number):
+        rows = self.conn.execute(
+            "SELECT chat_id FROM deliveries WHERE spreadsheet_id = ? AND month = ? AND post_number = ?",
+            (spreadsheet_id, month, post_number),
+        ).fetchall()
+        return {r[0] for r in rows}
+
+    def save_ready_post(self, spreadsheet_id, month, post_number, topic, text):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ready_posts (spreadsheet_id, month, post_number, topic, text, generated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (spreadsheet_id, month, post_number, topic, text, time.time()),
+            )
+
+    def get_ready_post(self, spreadsheet_id, month, post_number, topic, max_age):
+        """Готовый текст поста, если он сгенерирован для той же темы и не старше max_age секунд."""
+        row = self.conn.execute(
+            "SELECT topic, text, generated_at FROM ready_posts "
+            "WHERE spreadsheet_id = ? AND month = ? AND post_number = ?",
+            (spreadsheet_id, month, post_number),
+        ).fetchone()
+        if row is None:
+            return None
+        ready_topic, text, generated_at = row
+        if ready_topic != topic or time.time() - generated_at > max_age:
+            return None
+        return text
+
+    def delete_ready_post(self, spreadsheet_id, month, post_number):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM ready_posts WHERE spreadsheet_id = ? AND month = ? AND post_number = ?",
+                (spreadsheet_id, month, post_number),
+            )
+
+    def get_media(self, bot_id, source):
+        """Кэш file_id Telegram: (fingerprint, file_id, checked_at) или None."""
+        return self.conn.execute(
+            "SELECT fingerprint, file_id, checked_at FROM media WHERE bot_id = ? AND source = ?",
+            (bot_id, source),
+        ).fetchone()
+
+    def save_media(self, bot_id, source, fingerprint, file_id):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO media (bot_id, source, fingerprint, file_id, checked_at) VALUES (?, ?, ?, ?, ?)",
+                (bot_id, source, fingerprint, file_id, time.time()),
+            )
+
+    def delete_media(self, bot_id, source):
+        with self.conn:
+            self.conn.execute("DELETE FROM media WHERE bot_id = ? AND source = ?", (bot_id, source))
+
+    def add_promo_variants(self, pool, texts):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO promo_variants (pool, text, created_at) VALUES (?, ?, ?)",
+                [(pool, text, time.time()) for text in texts],
+            )
+
+    def take_promo_variant(self, pool):
+        """Самый старый неиспользованный вариант; помечается использованным."""
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT id, text FROM promo_variants WHERE pool = ? AND used_at IS NULL ORDER BY id LIMIT 1",
+                (pool,),
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE promo_variants SET used_at = ? WHERE id = ?", (time.time(), row[0]))
+        return row[1]
+
+    def promo_pool_size(self, pool):
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM promo_variants WHERE pool = ? AND used_at IS NULL",
+            (pool,),
+        ).fetchone()
+        return row[0]
+
+    def promo_texts(self, pool, recent_used=30):
+        """Тексты, с которыми сравниваются новые варианты: весь запас и недавно отправленные."""
+        rows = self.conn.execute(
+            "SELECT text FROM promo_variants WHERE pool = ? AND used_at IS NULL "
+            "UNION ALL SELECT text FROM (SELECT text FROM promo_variants WHERE pool = ? AND used_at IS NOT NULL "
+            "ORDER BY used_at DESC LIMIT ?)",
+            (pool, pool, recent_used),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def add_planned_topics(self, spreadsheet_id, topics):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO planned_topics (spreadsheet_id, topic, created_at) VALUES (?, ?, ?)",
+                [(spreadsheet_id, topic, time.time()) for topic in topics],
+            )
+
+    def take_planned_topics(self, spreadsheet_id, month, count):
+        """Забирает из запаса до count самых старых тем и закрепляет их за месяцем."""
+        with self.conn:
+            rows = self.conn.execute(
+                "SELECT id, topic FROM planned_topics WHERE spreadsheet_id = ? AND month IS NULL ORDER BY id LIMIT ?",
+                (spreadsheet_id, count),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE planned_topics SET month = ? WHERE id = ?",
+                [(month, r[0]) for r in rows],
+            )
+        return [r[1] for r in rows]
+
+    def planned_count(self, spreadsheet_id):
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM planned_topics WHERE spreadsheet_id = ? AND month IS NULL",
+            (spreadsheet_id,),
+        ).fetchone()
+        return row[0]
+
+    def known_topics(self, spreadsheet_id):
+        """Все темы, с которыми сравниваются новые: запас, выданные раньше и темы из листов."""
+        rows = self.conn.execute(
+            "SELECT topic FROM planned_topics WHERE spreadsheet_id = ? "
+            "UNION SELECT topic FROM posts WHERE spreadsheet_id = ? AND topic != ''",
+            (spreadsheet_id, spreadsheet_id),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def add_token_usage(self, day, tenant, model, prompt_tokens, completion_tokens):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO token_usage (day, tenant, model, calls, prompt_tokens, completion_tokens) "
+                "VALUES (?, ?, ?, 1, ?, ?) ON CONFLICT (day, tenant, model) DO UPDATE SET "
+                "calls = calls + 1, prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens",
+                (day, tenant, model, prompt_tokens, completion_tokens),
+            )
+
+    def tokens_used(self, tenant, day_prefix):
+        """Сумма токенов клиента за дни, начинающиеся с day_prefix ('2024-05-17' — день, '2024-05' — месяц)."""
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM token_usage "
+            "WHERE tenant = ? AND day LIKE ?",
+            (tenant, day_prefix + "%"),
+        ).fetchone()
+        return row[0]
+
+    def get_value(self, key):
+        row = self.conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_value(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+
+    def get_modified_time(self, spreadsheet_id):
+        row = self.conn.execute(
+            "SELECT modified_time FROM spreadsheets WHERE spreadsheet_id = ?",
+            (spreadsheet_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_modified_time(self, spreadsheet_id, modified_time):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO spreadsheets (spreadsheet_id, modified_time) VALUES (?, ?)",
+                (spreadsheet_id, modified_time),
+            )
+
+
+_store = None
+
+
+def init_store(path="plan.db"):
+    global _store
+    if _store is None:
+        _store = PlanStore(path)
+    return _store
+
+
+def get_store():
+    if _store is None:
+        return init_store()
+    return _store
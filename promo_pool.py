@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import json
+import logging
+
+import prompts
+import tenants
+import token_budget
+from openai_client import generate_variants
+from plan_store import get_store
+from similarity import is_near_duplicate
+
+logger = logging.getLogger('post_bot.promo_pool')
+
+_refilling = set()
+
+
+def promo_messages(config):
+    return prompts.render(config, "promo", max_len=config["second_post_max_len"])
+
+
+def pool_key(messages, config):
+    # Пул привязан к клиенту, промпту и модели: сменили промпт — старые варианты не используются
+    raw = json.dumps([config["model_second"], config["second_post_max_len"], messages], ensure_ascii=False, sort_keys=True)
+    key = hashlib.sha1(raw.encode()).hexdigest()
+    tenant_id = config.get("tenant_id", "default")
+    return key if tenant_id == "default" else f"{tenant_id}:{key}"
+
+
+def take_variant(config, messages=None):
+    """Готовый вариант промо-поста или None, если запас пуст. При низком запасе запускает пополнение."""
+    messages = messages or promo_messages(config)
+    pool = pool_key(messages, config)
+    store = get_store()
+    text = store.take_promo_variant(pool)
+    if store.promo_pool_size(pool) < config["promo_pool_low_water"]:
+        start_refill(config, messages)
+    return text
+
+
+def start_refill(config, messages=None):
+    messages = messages or promo_messages(config)
+    pool = pool_key(messages, config)
+    if pool in _refilling:
+        return
+    _refilling.add(pool)
+    task = asyncio.create_task(refill(config, messages))
+    task.add_done_callback(lambda _: _refilling.discard(pool))
+
+
+async def refill(config, messages=None):
+    """Пополняет запас до promo_pool_size пакетными запросами (n вариантов за вызов).
+
+    Почти одинаковые варианты отбрасываются; число вызовов в сутки ограничено promo_max_daily_calls.
+    """
+    messages = messages or promo_messages(config)
+    pool = pool_key(messages, config)
+    store = get_store()
+    calls_key = f"promo_calls:{pool}:{tenants.today(config).isoformat()}"
+    added = 0
+    try:
+        while store.promo_pool_size(pool) < config["promo_pool_size"]:
+            calls = int(store.get_value(calls_key) or 0)
+            if calls >= config["promo_max_daily_calls"]:
+                logger.warning(f"Дневной лимит вызовов для промо-постов ({calls}) исчерпан.")
+                break
+            store.set_value(calls_key, str(calls + 1))
+            variants = await generate_variants(
+                messages=messages,
+                model=config["model_second"],
+                max_tokens=token_budget.max_tokens_for(config["second_post_max_len"]),
+                n=config["promo_batch_size"],
+                max_len=config["second_post_max_len"],
+                # Запас пополняется когда угодно, поэтому при нехватке бюджета токенов откладывается первым
+                priority="low",
+            )
+            known = store.promo_texts(pool)
+            fresh = []
+            for text in variants:
+                if text and not is_near_duplicate(text, known + fresh, config["promo_similarity"]):
+                    fresh.append(text)
+            store.add_promo_variants(pool, fresh)
+            added += len(fresh)
+            logger.debug(f"Промо-пул: получено {len(variants)} вариантов, уникальных {len(fresh)}.")
+            if not fresh:
+                break
+    except token_budget.BudgetDeferred as e:
+        # Запрос не отправлялся, дневной лимит вызовов не расходуем
+        store.set_value(calls_key, str(calls))
+        logger.info(f"Пополнение пула промо-постов отложено: {e}")
+    except Exception as e:
+        logger.error(f"Ошибка пополнения пула промо-постов: {e}", exc_info=True)
+    logger.info(f"Пул промо-постов пополнен на {added}, в запасе {store.promo_pool_size(pool)}.")
+    return added
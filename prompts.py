@@ -0,0 +1,71 @@
+import logging
+import re
+
+logger = logging.getLogger('post_bot.prompts')
+
+DEFAULT_COMPANY = "СТАРЭКС"
+
+# Шаблоны промптов по умолчанию. Клиент может переопределить любой из них
+# в файле клиентов (ключ "prompts"); {company} подставляется из company_name.
+TEMPLATES = {
+    "main_post": {
+        "system": (
+            "Ты — опытный механик по ремонту спецтехники со стажем 30 лет и работаешь в компании {company} уже более 5 лет."
+            "Пиши максимально длинно (около 1500-2000 символов), подробно, профессионально и увлекательно, "
+            "используя смайлы в тексте и заголовках, добавляй в пост всегда хэштеги, дай советы по обслуживанию и ремонту спецтехники, "
+            "привлекай покупателей своим опытом и умением убеждать. В конце поста упомяни себя и компанию {company}, "
+            "у которой есть все необходимые запчасти и услуги для ремонта спецтехники."
+        ),
+        "user": (
+            "Напиши подробный, красивый пост со смайликами на тему: '{topic}', поделись своим опытом как механика с опытом, "
+            "дай советы по обслуживанию и ремонту спецтехники, используй смайлы и призывай читателей к действию. "
+            "В конце упомяни {company} и то, что у компании {company} есть все для ремонта спецтехники."
+        ),
+    },
+    "promo": {
+        "system": (
+            "Ты — супер-маркетолог по продажам запчастей для спецтехники. Пиши ярко и убедительно, не длиннее {max_len} символов. "
+            "Призывай к общению в чат-боте, к заявкам, упоминай скидки и акции, используй смайлы, чтобы мотивировать читателя."
+        ),
+        "user": (
+            "Напиши привлекательный, продающий пост для продаж запчастей для спецтехники. Мотивируй читателя оставить заявку в чат-боте, "
+            "предложи акции, скидки, общение, используй смайлы и сделай текст максимально заманчивым."
+        ),
+    },
+    "topics": {
+        "system": "Ты — опытный механик по ремонту спецтехники со стажем 30 лет.",
+        "user": (
+            "Сгенерируй список из {count} кратких самых актуальных тем для постов о спецтехнике, запчастях и обслуживании. "
+            "Темы не должны повторять друг друга. Каждая тема на отдельной строке."
+        ),
+    },
+}
+
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+def substitute(text, values):
+    """Подставляет {name} из values; остальные фигурные скобки (JSON-примеры, смайлы) остаются как есть."""
+    return _PLACEHOLDER.sub(lambda m: str(values[m.group(1)]) if m.group(1) in values else m.group(0), text)
+
+
+def validate(overrides):
+    """Проверяет переопределения шаблонов из файла клиентов: известные имена и строковые system/user."""
+    for name, template in overrides.items():
+        if name not in TEMPLATES:
+            raise ValueError(f"Неизвестный шаблон промпта: {name}.")
+        if not isinstance(template, dict) or not all(
+            key in ("system", "user") and isinstance(text, str) for key, text in template.items()
+        ):
+            raise ValueError(f"Шаблон {name}: ожидаются строковые поля system и user.")
+
+
+def render(config, name, **values):
+    """Сообщения для OpenAI по шаблону name с учётом переопределений клиента."""
+    template = {**TEMPLATES[name], **config.get("prompts", {}).get(name, {})}
+    values = {"company": config.get("company_name") or DEFAULT_COMPANY, **values}
+    return [
+        {"role": "system", "content": substitute(template["system"], values)},
+        {"role": "user", "content": substitute(template["user"], values)},
+    ]
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('post_bot.publish_journal')
+
+
+class PublishJournal:
+    """Журнал публикаций: append-only JSON lines с fsync после каждой записи.
+
+    Перед отправкой пишется intent (в какие чаты уходит пост), после — result
+    с message_id по каждому чату (null — отправка не удалась). intent без result
+    после падения означает, что пост мог уйти: такой чат считается доставленным,
+    чтобы не опубликовать пост дважды.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def close(self):
+        self._file.close()
+
+    def append(self, record):
+        line = json.dumps({**record, "ts": round(time.time(), 3)}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    async def write(self, record):
+        # fsync может занять десятки миллисекунд, поэтому не в event loop
+        await asyncio.to_thread(self.append, record)
+
+    async def intent(self, spreadsheet_id, month, post_number, chats):
+        await self.write({"op": "intent", "sid": spreadsheet_id, "month": month, "post": post_number, "chats": chats})
+
+    async def result(self, spreadsheet_id, month, post_number, message_ids):
+        await self.write({"op": "result", "sid": spreadsheet_id, "month": month, "post": post_number, "messages": message_ids})
+
+    def _read(self):
+        records = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Недописанная строка при падении во время записи
+                    logger.warning("Пропущена повреждённая строка журнала публикаций.")
+        return records
+
+    def replay(self, store):
+        """Переносит журнал в plan.db и очищает его. Возвращает (доставок, под вопросом)."""
+        pending = {}
+        delivered = 0
+        for record in self._read():
+            key = (record["sid"], record["month"], record["post"])
+            if record["op"] == "intent":
+                pending.setdefault(key, set()).update(record["chats"])
+            elif record["op"] == "result":
+                for chat_id, message_id in record["messages"].items():
+                    pending.get(key, set()).discard(chat_id)
+                    if message_id is not None:
+                        store.record_delivery(*key, chat_id, message_id)
+                        delivered += 1
+        in_doubt = 0
+        for (spreadsheet_id, month, post_number), chats in pending.items():
+            for chat_id in chats:
+                if chat_id in store.delivered_chats(spreadsheet_id, month, post_number):
+                    continue
+                # message_id неизвестен; повторно не отправляем
+                store.record_delivery(spreadsheet_id, month, post_number, chat_id, 0)
+                in_doubt += 1
+                logger.warning(
+                    f"Пост №{post_number} ({month}) мог уйти в {chat_id} до остановки бота, повторно не отправляем.",
+                    extra={"post_number": post_number, "month": month, "chat_id": chat_id},
+                )
+        self._truncate()
+        if delivered or in_doubt:
+            logger.info(f"Журнал публикаций восстановлен: доставок {delivered}, под вопросом {in_doubt}.")
+        return delivered, in_doubt
+
+    def _truncate(self):
+        # Всё уже лежит в plan.db, журнал начинается заново
+        with self._lock:
+            self._file.close()
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self._file = open(self.path, "a", encoding="utf-8")
+
+
+_journal = None
+
+
+def init_journal(path="publish.journal"):
+    global _journal
+    if _journal is None:
+        _journal = PublishJournal(path)
+    return _journal
+
+
+def get_journal():
+    if _journal is None:
+        return init_journal()
+    return _journal
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger('post_bot.rate_limiter')
+
+# Лимиты Telegram Bot API: ~30 сообщений в секунду на бота,
+# не чаще 1 сообщения в секунду в один чат и не больше 20 в минуту в группу/канал.
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+GROUP_PER_MINUTE = 20
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Сколько секунд ждать до следующего свободного токена."""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds):
+        # Подсказка сервера (RetryAfter) важнее собственного расчёта
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class TelegramRateLimiter:
+    """Общий ограничитель отправок: глобальное ведро на бота и ведра на каждый чат."""
+
+    def __init__(self, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, group_per_minute=GROUP_PER_MINUTE):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_per_minute = group_per_minute
+        self.chats = {}
+
+    def _chat_buckets(self, chat_id):
+        buckets = self.chats.get(chat_id)
+        if buckets is None:
+            buckets = [
+                TokenBucket(self.chat_rate, 1),
+                TokenBucket(self.group_per_minute / 60, self.group_per_minute),
+            ]
+            self.chats[chat_id] = buckets
+        return buckets
+
+    async def acquire(self, chat_id):
+        buckets = [self.global_bucket] + self._chat_buckets(chat_id)
+        while True:
+            now = time.monotonic()
+            wait = max(bucket.delay(now) for bucket in buckets)
+            if wait <= 0:
+                for bucket in buckets:
+                    bucket.take()
+                return
+            logger.debug(f"Лимит отправки в чат {chat_id}, ждём {wait:.2f} сек.")
+            await asyncio.sleep(wait)
+
+    def retry_after(self, chat_id, seconds):
+        logger.debug(f"RetryAfter {seconds} сек. для чата {chat_id}.")
+        for bucket in self._chat_buckets(chat_id):
+            bucket.block(seconds)
@@ -0,0 +1,187 @@
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('post_bot.resilience')
+
+
+class CircuitOpenError(Exception):
+    """Зависимость признана недоступной, вызов отклонён без обращения к ней."""
+
+
+class DeadlineExceeded(Exception):
+    """Задача не успевает до следующего слота расписания."""
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt):
+        # Экспоненциальная пауза с полным джиттером, чтобы повторы не шли синхронно
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """closed -> open после failure_threshold ошибок подряд -> half-open через reset_timeout.
+
+    В half-open пропускается один пробный вызов: успех закрывает цепь, ошибка снова открывает.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def before_call(self):
+        if self.state == "closed":
+            return
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"{self.name}: цепь разомкнута")
+            self.state = "half_open"
+            logger.info(f"{self.name}: пробный вызов после паузы {self.reset_timeout:.0f} сек.")
+        if self.probe_in_flight:
+            raise CircuitOpenError(f"{self.name}: идёт пробный вызов")
+        self.probe_in_flight = True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"{self.name}: сервис снова доступен.")
+        self.state = "closed"
+        self.failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"{self.name}: {self.failures} ошибок подряд, временно прекращаем обращения.")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        # Вызов завершился ошибкой, не говорящей о здоровье сервиса (например, лимит запросов)
+        self.probe_in_flight = False
+
+
+_settings = {
+    "max_attempts": 3,
+    "base_delay": 1.0,
+    "max_delay": 30.0,
+    "failure_threshold": 5,
+    "reset_timeout": 60.0,
+}
+_breakers = {}
+
+
+def configure(max_attempts=None, base_delay=None, max_delay=None, failure_threshold=None, reset_timeout=None):
+    for key, value in (
+        ("max_attempts", max_attempts),
+        ("base_delay", base_delay),
+        ("max_delay", max_delay),
+        ("failure_threshold", failure_threshold),
+        ("reset_timeout", reset_timeout),
+    ):
+        if value is not None:
+            _settings[key] = value
+    _breakers.clear()
+
+
+def default_policy():
+    return RetryPolicy(_settings["max_attempts"], _settings["base_delay"], _settings["max_delay"])
+
+
+def get_breaker(name):
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name, _settings["failure_threshold"], _settings["reset_timeout"])
+    return breaker
+
+
+def reset():
+    _breakers.clear()
+
+
+_deadline = contextvars.ContextVar("job_deadline", default=None)
+
+
+@contextmanager
+def job_deadline(seconds):
+    """Ограничивает по времени все повторы внутри задачи (наследуется дочерними task)."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left():
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+async def call_with_retry(func, name, policy=None, breaker=None, retry_on=(Exception,),
+                          should_retry=lambda e: True, is_failure=lambda e: True,
+                          retry_after=lambda e: None, on_retry=None):
+    """Вызывает func() с повторами.
+
+    retry_on и should_retry — какие ошибки повторять; is_failure — какие из них
+    считаются отказом зависимости для предохранителя; retry_after — пауза,
+    подсказанная сервером.
+    """
+    policy = policy or default_policy()
+    for attempt in range(1, policy.max_attempts + 1):
+        left = time_left()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"{name}: время задачи истекло")
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            if left is not None:
+                result = await asyncio.wait_for(func(), left)
+            else:
+                result = await func()
+        except asyncio.TimeoutError as e:
+            if breaker is not None:
+                breaker.release()
+            if time_left() is not None and time_left() <= 0:
+                raise DeadlineExceeded(f"{name}: время задачи истекло") from e
+            raise
+        except retry_on as e:
+            retryable = should_retry(e)
+            if breaker is not None:
+                if retryable and is_failure(e):
+                    breaker.record_failure()
+                else:
+                    breaker.release()
+            if not retryable or attempt >= policy.max_attempts:
+                raise
+            hint = retry_after(e)
+            delay = hint if hint is not None else policy.backoff(attempt)
+            left = time_left()
+            if left is not None and delay >= left:
+                raise DeadlineExceeded(f"{name}: повтор через {delay:.1f} сек. не укладывается в срок задачи") from e
+            if on_retry is not None:
+                on_retry(e, attempt, delay)
+            await asyncio.sleep(delay)
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+            raise
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
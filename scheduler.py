@@ -1,32 +1,170 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.events import EVENT_JOB_SUBMITTED
+import datetime
+import coordination
+import functools
 import logging
+import time
+import log_setup
+import metrics
+import resilience
+import tenants
 
 logger = logging.getLogger('post_bot.scheduler')
 
+LAG_WARNING_SECONDS = 60
+# Запас до следующей публикации, к которому задача должна закончить повторы
+DEADLINE_MARGIN_SECONDS = 60
+MIN_DEADLINE_SECONDS = 30
+
+
+def _tenant(config):
+    return config.get("tenant_id", tenants.DEFAULT_TENANT)
+
+
+def job_id(config, name):
+    # Задачи всех клиентов живут в одном планировщике, id начинается с id клиента
+    return f"{_tenant(config)}:{name}"
+
+
+def _job(config, name, func, leader=True):
+    # Задача выполняется в контексте клиента, а её записи в логе помечаются job_id.
+    # leader — только на ведущей реплике (при нескольких репликах бота).
+    jid = job_id(config, name)
+    if leader:
+        func = coordination.leader_only(func)
+
+    @functools.wraps(func)
+    async def run(*args):
+        with log_setup.job_context(jid):
+            start = time.monotonic()
+            try:
+                return await func(*args)
+            finally:
+                logger.debug(f"Задача {jid} завершена.", extra={"latency": round(time.monotonic() - start, 3)})
+    return tenants.bind(config, run)
+
+
+def _is_publish_job(job_name, prefix):
+    if not job_name.startswith(prefix):
+        return False
+    name = job_name[len(prefix):]
+    return name == 'daily_post' or name.startswith('second_post_')
+
+
+def seconds_to_next_publish(scheduler, prefix=""):
+    """Сколько секунд до ближайшего следующего запуска публикующей задачи (того же клиента)."""
+    run_times = [
+        job.next_run_time for job in scheduler.get_jobs()
+        if _is_publish_job(job.id, prefix) and job.next_run_time is not None
+    ]
+    if not run_times:
+        return None
+    return (min(run_times) - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+
+
+def with_deadline(scheduler, func, prefix=""):
+    # Повторы внутри публикации не должны залезать в следующий слот расписания
+    @functools.wraps(func)
+    async def run(*args):
+        seconds = seconds_to_next_publish(scheduler, prefix)
+        if seconds is None:
+            return await func(*args)
+        seconds = max(seconds - DEADLINE_MARGIN_SECONDS, MIN_DEADLINE_SECONDS)
+        with resilience.job_deadline(seconds):
+            return await func(*args)
+    return run
+
+
+def instrument_scheduler(scheduler):
+    # Задержка между временем по расписанию и фактическим запуском задачи
+    def on_submitted(event):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for run_time in event.scheduled_run_times:
+            lag = (now - run_time).total_seconds()
+            metrics.observe("scheduler_job_lag_seconds", lag, job=event.job_id)
+            if lag > LAG_WARNING_SECONDS:
+                logger.warning(f"Задача {event.job_id} запущена с опозданием на {lag:.0f} сек.")
+
+    scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+
 async def schedule_tasks(scheduler, daily_hour, daily_minute, second_times, publish_daily, publish_second, sheet, config, bot):
     logger.debug("Настройка расписания.")
 
     # Ежедневный пост в 9:00
+    prefix = job_id(config, "")
     scheduler.add_job(
-        publish_daily,
+        _job(config, 'daily_post', with_deadline(scheduler, publish_daily, prefix)),
         'cron',
         hour=daily_hour,
         minute=daily_minute,
-        id='daily_post',
-        name='Ежедневный основной пост',
+        timezone=config["timezone"],
+        id=job_id(config, 'daily_post'),
+        name=f'Ежедневный основной пост ({_tenant(config)})',
         args=[sheet, config, bot]
     )
-    logger.info(f"Ежедневный пост в {daily_hour:02d}:{daily_minute:02d}.")
+    logger.info(f"Ежедневный пост в {daily_hour:02d}:{daily_minute:02d} ({_tenant(config)}).")
 
     # Дополнительные посты
     for idx, st in enumerate(second_times, start=1):
         scheduler.add_job(
-            publish_second,
+            _job(config, f'second_post_{idx}', with_deadline(scheduler, publish_second, prefix)),
             'cron',
             hour=st["hour"],
             minute=st["minute"],
-            id=f'second_post_{idx}',
-            name=f'Дополнительный пост {idx}',
+            timezone=config["timezone"],
+            id=job_id(config, f'second_post_{idx}'),
+            name=f'Дополнительный пост {idx} ({_tenant(config)})',
             args=[bot, config]
         )
-        logger.info(f"Доп. пост {idx} в {st['hour']:02d}:{st['minute']:02d}.")
+        logger.info(f"Доп. пост {idx} в {st['hour']:02d}:{st['minute']:02d} ({_tenant(config)}).")
+
+async def schedule_sync(scheduler, interval_minutes, sync_plan, sheet, config):
+    # Фоновая синхронизация локального зеркала с Google Sheets
+    scheduler.add_job(
+        _job(config, 'sheets_sync', sync_plan, leader=False),
+        'interval',
+        minutes=interval_minutes,
+        id=job_id(config, 'sheets_sync'),
+        name=f'Синхронизация с Google Sheets ({_tenant(config)})',
+        args=[sheet]
+    )
+    logger.info(f"Синхронизация с таблицей {sheet.id} каждые {interval_minutes} мин.")
+
+async def schedule_pregen(scheduler, hour, minute, pregenerate, sheet, config):
+    # Генерация постов на ближайшие дни в непиковое время
+    scheduler.add_job(
+        _job(config, 'pregen_posts', pregenerate),
+        'cron',
+        hour=hour,
+        minute=minute,
+        timezone=config["timezone"],
+        id=job_id(config, 'pregen_posts'),
+        name=f'Предгенерация основных постов ({_tenant(config)})',
+        args=[sheet, config]
+    )
+    logger.info(f"Предгенерация постов в {hour:02d}:{minute:02d} ({_tenant(config)}).")
+
+async def schedule_metrics_dump(scheduler, interval_seconds, write_json, path):
+    scheduler.add_job(
+        write_json,
+        'interval',
+        seconds=interval_seconds,
+        id='metrics_dump',
+        name='Запись метрик в JSON',
+        args=[path]
+    )
+    logger.info(f"Метрики пишутся в {path} каждые {interval_seconds} сек.")
+
+async def schedule_heartbeat(scheduler, interval_seconds, heartbeat):
+    # Продление аренды ведущей реплики; резервная реплика тем же вызовом забирает истёкшую
+    scheduler.add_job(
+        heartbeat,
+        'interval',
+        seconds=interval_seconds,
+        id='coord_heartbeat',
+        name='Аренда ведущей реплики',
+        max_instances=1,
+        coalesce=True,
+    )
+    logger.info(f"Проверка ведущей реплики каждые {interval_seconds} сек.")
@@ -1,29 +1,101 @@
 import gspread
 import logging
-from gspread_formatting import format_cell_range, CellFormat, Color, TextFormat
+from gspread_formatting import format_cell_ranges, CellFormat, Color, TextFormat
 from oauth2client.service_account import ServiceAccountCredentials
 import asyncio
 import calendar
+import datetime
+import threading
+import time
 from openai_client import generate_post
-import re
+from plan_store import get_store
+from publish_journal import get_journal
+import metrics
+import prompts
+import coordination
+import resilience
+import tenants
+import topic_planner
 
 logger = logging.getLogger('post_bot.sheets_client')
 
+SYNC_MONTHS = 3  # сколько последних месяцев перечитывать при изменении таблицы
+
+async def _sheets_call(func, *args, **kwargs):
+    # Все вызовы gspread идут через поток; здесь же меряется их длительность
+    call = getattr(func, "__name__", "call")
+    try:
+        with metrics.timer("sheets_request_seconds", call=call):
+            return await asyncio.to_thread(func, *args, **kwargs)
+    except gspread.exceptions.WorksheetNotFound:
+        raise
+    except Exception:
+        metrics.inc("sheets_failures_total", call=call)
+        raise
+
+
+PUBLISHED_FORMAT = CellFormat(
+    textFormat=TextFormat(
+        bold=True,
+        foregroundColor=Color(0, 0.5, 0)
+    )
+)
+
+
+class SheetWriteBatch:
+    """Копит изменения значений и форматирования одного листа.
+
+    flush() отправляет все значения одним values_batch_update и всё
+    форматирование одним batch_update, вместо отдельного запроса на ячейку.
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.values = []
+        self.formats = []
+
+    def update(self, cell_range, values):
+        self.values.append({"range": cell_range, "values": values})
+
+    def format(self, cell_range, cell_format):
+        self.formats.append((cell_range, cell_format))
+
+    def __len__(self):
+        return len(self.values) + len(self.formats)
+
+    async def flush(self):
+        if self.values:
+            values, self.values = self.values, []
+            logger.debug(f"Пакетная запись {len(values)} диапазонов в лист {self.worksheet.title}.")
+            await _sheets_call(self.worksheet.batch_update, values)
+        if self.formats:
+            formats, self.formats = self.formats, []
+            logger.debug(f"Пакетное форматирование {len(formats)} диапазонов в листе {self.worksheet.title}.")
+            await _sheets_call(format_cell_ranges, self.worksheet, formats)
+
+# Один авторизованный клиент (и HTTP-сессия) на файл учётных данных, общий для всех таблиц
+_clients = {}
+_clients_lock = threading.Lock()
+
+SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive",
+]
+
+
 async def get_gsheet_client(creds_path="credentials.json", spreadsheet_id=None):
     if not spreadsheet_id:
         logger.error("Не указан spreadsheet_id.")
         raise ValueError("Необходимо указать spreadsheet_id.")
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive.file",
-        "https://www.googleapis.com/auth/drive",
-    ]
     try:
-        logger.debug(f"Загрузка учётных данных из {creds_path}.")
-        creds = await asyncio.to_thread(ServiceAccountCredentials.from_json_keyfile_name, creds_path, scope)
-        client = await asyncio.to_thread(gspread.authorize, creds)
-        spreadsheet = await asyncio.to_thread(client.open_by_key, spreadsheet_id)
+        client = _clients.get(creds_path)
+        if client is None:
+            logger.debug(f"Загрузка учётных данных из {creds_path}.")
+            creds = await _sheets_call(ServiceAccountCredentials.from_json_keyfile_name, creds_path, SCOPE)
+            client = _clients[creds_path] = await _sheets_call(gspread.authorize, creds)
+        spreadsheet = await _sheets_call(client.open_by_key, spreadsheet_id)
         logger.debug(f"Открыта таблица с ID {spreadsheet_id}.")
         return spreadsheet
     except gspread.exceptions.SpreadsheetNotFound:
@@ -36,162 +108,472 @@ async def get_gsheet_client(creds_path="credentials.json", spreadsheet_id=None):
         logger.error(f"Ошибка инициализации клиента Google Sheets: {e}", exc_info=True)
         raise
 
-async def get_unpublished_posts(sheet, m_name):
+
+class LazySpreadsheet:
+    """Таблица, которая открывается при первом удачном обращении.
+
+    Подставляется вместо gspread.Spreadsheet, если Google Sheets недоступен при запуске:
+    id известен сразу, поэтому публикация идёт по локальному зеркалу, а методы
+    (worksheet, worksheets, values_batch_get, ...) открывают таблицу в потоке _sheets_call.
+    """
+
+    def __init__(self, creds_path, spreadsheet_id):
+        self.id = spreadsheet_id
+        self._creds_path = creds_path
+        self._spreadsheet = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        with self._lock:
+            if self._spreadsheet is None:
+                with _clients_lock:
+                    client = _clients.get(self._creds_path)
+                    if client is None:
+                        creds = ServiceAccountCredentials.from_json_keyfile_name(self._creds_path, SCOPE)
+                        client = _clients[self._creds_path] = gspread.authorize(creds)
+                self._spreadsheet = client.open_by_key(self.id)
+                logger.info(f"Таблица {self.id} открыта после недоступности при запуске.")
+            return self._spreadsheet
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            return getattr(self._open(), name)(*args, **kwargs)
+        call.__name__ = name
+        return call
+
+
+async def open_spreadsheet(creds_path, spreadsheet_id):
+    """Таблица клиента; при временной недоступности Google Sheets — LazySpreadsheet.
+
+    Ошибки настройки (нет файла учётных данных, нет таблицы) по-прежнему не дают запустить клиента.
+    """
     try:
-        worksheet = await asyncio.to_thread(sheet.worksheet, m_name)
-    except gspread.exceptions.WorksheetNotFound:
-        logger.warning(f"Лист {m_name} не найден.")
-        return []
-    
-    data = await asyncio.to_thread(worksheet.get_all_values)
-    rows = data[1:]
-    unpublished = []
-    for i, row in enumerate(rows, start=2):
+        return await get_gsheet_client(creds_path, spreadsheet_id)
+    except (gspread.exceptions.SpreadsheetNotFound, FileNotFoundError, ValueError):
+        raise
+    except Exception as e:
+        logger.warning(f"Google Sheets недоступен ({e}), таблица {spreadsheet_id} откроется при первом удачном обращении.")
+        return LazySpreadsheet(creds_path, spreadsheet_id)
+
+_worksheets = {}
+
+
+async def _get_worksheet(sheet, m_name):
+    key = (sheet.id, m_name)
+    worksheet = _worksheets.get(key)
+    if worksheet is None:
+        worksheet = await _sheets_call(sheet.worksheet, m_name)
+        _worksheets[key] = worksheet
+    return worksheet
+
+
+def _parse_rows(data, m_name):
+    rows = []
+    for i, row in enumerate(data[1:], start=2):
         post_number_str = row[0].strip() if len(row) > 0 else ""
         topic = row[1].strip() if len(row) > 1 else ""
         status = row[2].strip() if len(row) > 2 else ""
-        if status.lower() != "опубликовано" and topic:
-            try:
-                post_number = int(post_number_str)
-                unpublished.append((i, post_number, topic, worksheet))
-            except ValueError:
-                logger.warning(f"Неверный номер поста в строке {i}: {post_number_str}")
-                continue
-    unpublished.sort(key=lambda x: x[1])
-    return unpublished
+        try:
+            post_number = int(post_number_str)
+        except ValueError:
+            if topic:
+                logger.warning(f"Неверный номер поста в строке {i} ({m_name}): {post_number_str}", extra={"month": m_name})
+            post_number = None
+        rows.append((i, post_number, topic, status))
+    return rows
 
-async def update_status_sync(worksheet, row_index):
+
+async def sync_month(sheet, m_name):
+    """Перечитывает лист месяца целиком и обновляет локальное зеркало."""
+    try:
+        worksheet = await _get_worksheet(sheet, m_name)
+        data = await _sheets_call(worksheet.get_all_values)
+    except gspread.exceptions.WorksheetNotFound:
+        _worksheets.pop((sheet.id, m_name), None)
+        raise
+    get_store().replace_month(sheet.id, m_name, _parse_rows(data, m_name))
+    logger.debug(f"Лист {m_name} синхронизирован с локальным зеркалом.", extra={"month": m_name})
+    return worksheet
+
+
+async def reconcile_months(sheet, months):
+    """Загружает несколько месяцев в зеркало за три запроса: время изменения, метаданные таблицы и один batch_get.
+
+    Объекты листов берутся из тех же метаданных, поэтому дальнейшая работа
+    с этими месяцами не требует отдельных sheet.worksheet().
+    """
+    store = get_store()
+    # С сохранённым временем изменения первая sync_plan не перечитывает только что загруженные листы.
+    # Берём его до чтения, чтобы правка между запросами не потерялась.
+    try:
+        modified_time = await _sheets_call(sheet.get_lastUpdateTime)
+    except Exception as e:
+        logger.warning(f"Не удалось проверить время изменения таблицы: {e}")
+        modified_time = None
+    worksheets = {ws.title: ws for ws in await _sheets_call(sheet.worksheets)}
+    present = [m_name for m_name in months if m_name in worksheets]
+    for m_name in present:
+        _worksheets[(sheet.id, m_name)] = worksheets[m_name]
+    if present:
+        response = await _sheets_call(sheet.values_batch_get, [f"'{m_name}'!A1:D" for m_name in present])
+        for m_name, value_range in zip(present, response.get("valueRanges", [])):
+            store.replace_month(sheet.id, m_name, _parse_rows(value_range.get("values", []), m_name))
+    if modified_time is not None:
+        store.set_modified_time(sheet.id, modified_time)
+    missing = [m_name for m_name in months if m_name not in worksheets]
+    logger.info(f"Сверка при запуске: загружены листы {present}, отсутствуют {missing}.")
+    return present, missing
+
+
+async def sync_plan(sheet):
+    """Периодическая синхронизация: отправка отложенных статусов и чтение изменённых листов."""
+    store = get_store()
+    await flush_status_updates(sheet)
+    try:
+        modified_time = await _sheets_call(sheet.get_lastUpdateTime)
+    except Exception as e:
+        logger.warning(f"Не удалось проверить время изменения таблицы: {e}")
+        return
+    if modified_time == store.get_modified_time(sheet.id):
+        logger.debug("Таблица не менялась с последней синхронизации.")
+        return
+    for m_name in store.months(sheet.id)[-SYNC_MONTHS:]:
+        try:
+            await sync_month(sheet, m_name)
+        except gspread.exceptions.WorksheetNotFound:
+            logger.warning(f"Лист {m_name} пропал из таблицы.", extra={"month": m_name})
+        except Exception as e:
+            logger.error(f"Ошибка синхронизации листа {m_name}: {e}", exc_info=True, extra={"month": m_name})
+            return
+    store.set_modified_time(sheet.id, modified_time)
+
+
+async def get_unpublished_posts(sheet, m_name):
+    store = get_store()
+    if not store.has_month(sheet.id, m_name):
+        try:
+            await sync_month(sheet, m_name)
+        except gspread.exceptions.WorksheetNotFound:
+            logger.warning(f"Лист {m_name} не найден.", extra={"month": m_name})
+            return []
+    return store.unpublished(sheet.id, m_name)
+
+async def update_status_sync(worksheet, row_index, batch=None, status="Опубликовано", delivery=None):
+    # С batch изменение только ставится в очередь, запись делает batch.flush()
+    own_batch = batch is None
+    if own_batch:
+        batch = SheetWriteBatch(worksheet)
     try:
-        await asyncio.to_thread(worksheet.update_cell, row_index, 3, "Опубликовано")
-        green_text_format = CellFormat(
-            textFormat=TextFormat(
-                bold=True,
-                foregroundColor=Color(0, 0.5, 0)
-            )
-        )
         cell_range = f"C{row_index}"
-        await asyncio.to_thread(format_cell_range, worksheet, cell_range, green_text_format)
+        if delivery is None:
+            batch.update(cell_range, [[status]])
+        else:
+            batch.update(f"C{row_index}:D{row_index}", [[status, delivery]])
+        if status.lower() == "опубликовано":
+            batch.format(cell_range, PUBLISHED_FORMAT)
+        if own_batch:
+            await batch.flush()
     except Exception as e:
         logger.error(f"Ошибка обновления статуса поста: {e}", exc_info=True)
         raise
 
+async def flush_status_updates(sheet):
+    """Записывает в таблицу накопленные в зеркале статусы, по пакету на лист.
+
+    При ошибке строки остаются помеченными и уйдут при следующей синхронизации.
+    """
+    store = get_store()
+    by_month = {}
+    for m_name, row_index, status, delivery, revision in store.pending(sheet.id):
+        by_month.setdefault(m_name, []).append((row_index, status, delivery, revision))
+    if not by_month:
+        return 0
+
+    unchanged = await _unchanged_since_sync(sheet)
+    written = 0
+    for m_name, items in by_month.items():
+        try:
+            worksheet = await _get_worksheet(sheet, m_name)
+            batch = SheetWriteBatch(worksheet)
+            if any(delivery is not None for _, _, delivery, _ in items) and worksheet.col_count < 4:
+                # Старые листы были в три колонки; результаты по каналам пишем в D
+                await _sheets_call(worksheet.add_cols, 4 - worksheet.col_count)
+                batch.update("D1", [["Каналы"]])
+            for row_index, status, delivery, _ in items:
+                await update_status_sync(worksheet, row_index, batch=batch, status=status, delivery=delivery)
+            await batch.flush()
+        except Exception as e:
+            logger.error(f"Ошибка записи статусов в лист {m_name}, повторим позже: {e}", exc_info=True, extra={"month": m_name})
+            continue
+        store.clear_dirty(sheet.id, [(m_name, row_index, revision) for row_index, _, _, revision in items])
+        written += len(items)
+        logger.info(f"Статусы {len(items)} постов ({m_name}) записаны в таблицу одним пакетом.", extra={"month": m_name})
+    if written and unchanged:
+        # Своя запись тоже сдвигает время изменения таблицы; запоминаем его,
+        # чтобы sync_plan не перечитывал листы из-за неё
+        await _remember_modified_time(sheet)
+    return written
+
+
+async def _unchanged_since_sync(sheet):
+    """True, если таблицу никто не менял после последнего чтения листов в зеркало."""
+    known = get_store().get_modified_time(sheet.id)
+    if known is None:
+        return False
+    try:
+        return await _sheets_call(sheet.get_lastUpdateTime) == known
+    except Exception as e:
+        logger.warning(f"Не удалось проверить время изменения таблицы: {e}")
+        return False
+
+
+async def _remember_modified_time(sheet):
+    # Правка, сделанная между нашей записью и этим запросом, будет замечена при следующем изменении таблицы
+    try:
+        get_store().set_modified_time(sheet.id, await _sheets_call(sheet.get_lastUpdateTime))
+    except Exception as e:
+        logger.warning(f"Не удалось проверить время изменения таблицы: {e}")
+
 async def ensure_month_sheet(sheet, year, month, config, up_to_day=None):
     m_name = f"{year}-{month:02d}"
     d_in_month = calendar.monthrange(year, month)[1]
     if up_to_day is None:
         up_to_day = d_in_month
 
+    store = get_store()
     try:
-        worksheet = await asyncio.to_thread(sheet.worksheet, m_name)
-        data = await asyncio.to_thread(worksheet.get_all_values)
-        existing_topics = sum(1 for row in data[1:] if row[1].strip())
+        synced = not store.has_month(sheet.id, m_name)
+        if synced:
+            await sync_month(sheet, m_name)
+        existing_topics = store.topic_count(sheet.id, m_name)
         required_topics = d_in_month
 
+        if existing_topics < required_topics and not coordination.is_leader():
+            # Лист дополняет только ведущая реплика: иначе две реплики допишут разные темы в одни строки.
+            # Остальные лишь перечитывают лист, чтобы увидеть уже добавленные темы.
+            if not synced:
+                await sync_month(sheet, m_name)
+            logger.info(f"Темы в {m_name} добавит ведущая реплика.", extra={"month": m_name})
+            return m_name, 0
+
         if existing_topics < required_topics:
             missing_topics = required_topics - existing_topics
-            logger.info(f"Недостаёт {missing_topics} тем в {m_name}. Генерируем...")
-            topics_response = await generate_post(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Ты — опытный механик по ремонту спецтехники со стажем 30 лет."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Сгенерируй список из {missing_topics} кратких тем для постов о спецтехнике, запчастях и обслуживании. Каждая тема на отдельной строке."
-                    },
-                ],
-                model=config["model_main"],
-                max_tokens=1000,
-                temperature=0.7,
-                max_len=config["main_post_max_len"],
-            )
-            topics = [re.sub(r'^\d+\.\s*', '', t.strip()) for t in topics_response.split('\n') if t.strip()]
-            topics = topics[:missing_topics]
+            logger.info(f"Недостаёт {missing_topics} тем в {m_name}. Берём из плана...", extra={"month": m_name})
+            topics = await topic_planner.take_topics(sheet.id, m_name, missing_topics, config)
 
+            worksheet = await _get_worksheet(sheet, m_name)
             if worksheet.row_count < required_topics + 1:
-                await asyncio.to_thread(worksheet.resize, rows=required_topics + 1)
+                await _sheets_call(worksheet.resize, rows=required_topics + 1)
 
-            for idx, topic in enumerate(topics, start=existing_topics + 1):
-                row_data = [str(idx), topic, ""]
-                await asyncio.to_thread(worksheet.update, f"A{idx+1}:C{idx+1}", [row_data])
+            if topics:
+                first_row = existing_topics + 2
+                rows = [[str(idx), topic, ""] for idx, topic in enumerate(topics, start=existing_topics + 1)]
+                batch = SheetWriteBatch(worksheet)
+                batch.update(f"A{first_row}:C{first_row + len(rows) - 1}", rows)
+                await batch.flush()
+                store.add_topics(sheet.id, m_name, [(first_row + i, int(r[0]), r[1]) for i, r in enumerate(rows)])
             return m_name, missing_topics
         else:
-            logger.info(f"В листе {m_name} уже есть все необходимые темы.")
+            logger.info(f"В листе {m_name} уже есть все необходимые темы.", extra={"month": m_name})
             return m_name, 0
 
     except gspread.exceptions.WorksheetNotFound:
-        logger.warning(f"Лист {m_name} не найден. Создаю новый.")
-        worksheet = await asyncio.to_thread(sheet.add_worksheet, title=m_name, rows=str(d_in_month + 1), cols="3")
-        await asyncio.to_thread(worksheet.update, "A1:C1", [["Номер поста", "Тема", "Статус"]])
-        logger.info(f"Создан новый лист '{m_name}'.")
-        topics_response = await generate_post(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Ты — опытный механик по ремонту спецтехники со стажем 30 лет."
-                },
-                {
-                    "role": "user",
-                    "content": f"Сгенерируй список из {d_in_month} кратких самых актуальных тем для постов о спецтехнике, запчастях и обслуживании. Каждая тема на отдельной строке."
-                },
-            ],
-            model=config["model_main"],
-            max_tokens=1000,
-            temperature=0.7,
-            max_len=config["main_post_max_len"],
-        )
-        topics = [re.sub(r'^\d+\.\s*', '', t.strip()) for t in topics_response.split('\n') if t.strip()]
-        topics = topics[:d_in_month]
+        if not coordination.is_leader():
+            logger.info(f"Лист {m_name} не найден, его создаст ведущая реплика.", extra={"month": m_name})
+            return m_name, 0
+        logger.warning(f"Лист {m_name} не найден. Создаю новый.", extra={"month": m_name})
+        worksheet = await _sheets_call(sheet.add_worksheet, title=m_name, rows=str(d_in_month + 1), cols="4")
+        _worksheets[(sheet.id, m_name)] = worksheet
+        batch = SheetWriteBatch(worksheet)
+        batch.update("A1:D1", [["Номер поста", "Тема", "Статус", "Каналы"]])
+        logger.info(f"Создан новый лист '{m_name}'.", extra={"month": m_name})
+        topics = await topic_planner.take_topics(sheet.id, m_name, d_in_month, config)
 
-        for idx, topic in enumerate(topics, start=1):
-            row_data = [str(idx), topic, ""]
-            await asyncio.to_thread(worksheet.update, f"A{idx+1}:C{idx+1}", [row_data])
+        rows = [[str(idx), topic, ""] for idx, topic in enumerate(topics, start=1)]
+        if rows:
+            batch.update(f"A2:C{len(rows) + 1}", rows)
+        await batch.flush()
+        store.add_topics(sheet.id, m_name, [(i + 2, int(r[0]), r[1]) for i, r in enumerate(rows)])
 
         return m_name, d_in_month
     except Exception as e:
-        logger.error(f"Ошибка при подготовке листа {m_name}: {e}", exc_info=True)
+        logger.error(f"Ошибка при подготовке листа {m_name}: {e}", exc_info=True, extra={"month": m_name})
         raise
 
+async def generate_main_post(topic, config):
+    return await generate_post(
+        messages=prompts.render(config, "main_post", topic=topic),
+        model=config["model_main"],
+        max_tokens=2000,
+        temperature=0.7,
+        max_len=config["main_post_max_len"],
+    )
+
+
+async def pregenerate_posts(sheet, config):
+    """Заранее генерирует основные посты на ближайшие дни, чтобы в 9:00 осталось только отправить.
+
+    Готовый текст перегенерируется, если тема в таблице поменялась или он старше pregen_max_age_hours.
+    """
+    store = get_store()
+    max_age = config["pregen_max_age_hours"] * 3600
+    today = tenants.today(config)
+    generated = 0
+    for offset in range(config["pregen_days_ahead"]):
+        day = today + datetime.timedelta(days=offset)
+        m_name = f"{day.year}-{day.month:02d}"
+        posts = [p for p in await get_unpublished_posts(sheet, m_name) if p[1] == day.day]
+        for (row_index, post_number, topic) in posts:
+            if store.get_ready_post(sheet.id, m_name, post_number, topic, max_age) is not None:
+                continue
+            try:
+                text = await generate_main_post(topic, config)
+            except Exception as e:
+                logger.error(f"Ошибка предгенерации поста №{post_number} ({m_name}): {e}", exc_info=True, extra={"post_number": post_number, "month": m_name})
+                continue
+            store.save_ready_post(sheet.id, m_name, post_number, topic, text)
+            generated += 1
+            logger.info(f"Пост №{post_number} ({m_name}) сгенерирован заранее.", extra={"post_number": post_number, "month": m_name})
+    logger.debug(f"Предгенерация завершена, новых текстов: {generated}.")
+    return generated
+
+
+_publish_locks = {}
+
+
 async def publish_unpublished_posts(sheet, year, month, up_to_day, config, bot):
+    # Догоняющая публикация при старте идёт в фоне и может совпасть с плановой
+    lock = _publish_locks.setdefault(sheet.id, asyncio.Lock())
+    async with lock:
+        await _publish_unpublished_posts(sheet, year, month, up_to_day, config, bot)
+
+
+async def _publish_unpublished_posts(sheet, year, month, up_to_day, config, bot):
     m_name = f"{year}-{month:02d}"
     unpublished_posts = await get_unpublished_posts(sheet, m_name)
     unpublished_posts = [p for p in unpublished_posts if p[1] <= up_to_day]
 
-    logger.debug(f"Найдено {len(unpublished_posts)} неопубликованных постов для {m_name} до дня {up_to_day}.")
+    logger.debug(f"Найдено {len(unpublished_posts)} неопубликованных постов для {m_name} до дня {up_to_day}.", extra={"month": m_name})
+
+    if not unpublished_posts:
+        return
+
+    from telegram_client import fan_out_main_post
+    store = get_store()
+    journal = get_journal()
+    channels = config["channels"]
+    marked = 0
 
-    from telegram_client import send_main_post
-    for (row_index, post_number, topic, worksheet) in unpublished_posts:
+    def mark(row_index, post_number, delivered, latency=None):
+        extra = {"post_number": post_number, "month": m_name, "latency": latency}
+        delivery = ", ".join(
+            f"{ch['chat_id']}: {'✓' if str(ch['chat_id']) in delivered else '✗'}" for ch in channels
+        )
+        if all(str(ch["chat_id"]) in delivered for ch in channels):
+            store.mark_status(sheet.id, m_name, row_index, "Опубликовано", delivery)
+            store.delete_ready_post(sheet.id, m_name, post_number)
+            logger.info(f"Пост №{post_number} ({m_name}) опубликован.", extra=extra)
+        else:
+            store.mark_status(sheet.id, m_name, row_index, "Частично", delivery)
+            logger.warning(f"Пост №{post_number} ({m_name}) опубликован частично: {delivery}.", extra=extra)
+
+    # Посты, которые по журналу уже ушли во все каналы (бот упал до записи статуса),
+    # только отмечаются: без генерации и повторной отправки
+    pending_posts = []
+    for row_index, post_number, topic in unpublished_posts:
+        delivered = store.delivered_chats(sheet.id, m_name, post_number)
+        if all(str(ch["chat_id"]) in delivered for ch in channels):
+            mark(row_index, post_number, delivered)
+            marked += 1
+        else:
+            pending_posts.append((row_index, post_number, topic))
+
+    # Тексты генерируются параллельно (не больше catchup_concurrency одновременно),
+    # а отправка идёт строго по порядку номеров постов.
+    semaphore = asyncio.Semaphore(config["catchup_concurrency"])
+    tasks = [
+        asyncio.create_task(_prepare_post_text(sheet, m_name, post_number, topic, config, semaphore))
+        for (_, post_number, topic) in pending_posts
+    ]
+    processed = set()
+    try:
+        for (row_index, post_number, topic), task in zip(pending_posts, tasks):
+            left = resilience.time_left()
+            if left is not None and left <= 0:
+                logger.warning(f"Время задачи истекло, посты с №{post_number} ({m_name}) будут опубликованы в следующий раз.", extra={"post_number": post_number, "month": m_name})
+                break
+            processed.add(post_number)
+            started = nothing_sent = False
+            try:
+                post_text = await task
+                if post_text is None:
+                    logger.debug(f"Пост №{post_number} ({m_name}) публикует другая реплика.", extra={"post_number": post_number, "month": m_name})
+                    continue
+                # Текст сгенерирован один раз; при повторе шлём только в каналы, где поста ещё нет
+                delivered = store.delivered_chats(sheet.id, m_name, post_number)
+                targets = [ch for ch in channels if str(ch["chat_id"]) not in delivered]
+                if not await coordination.start_post(sheet.id, m_name, post_number):
+                    logger.warning(f"Аренда поста №{post_number} ({m_name}) истекла, его публикует другая реплика.", extra={"post_number": post_number, "month": m_name})
+                    continue
+                started = True
+                # Намерение фиксируется на диске до отправки, результат — сразу после
+                await journal.intent(sheet.id, m_name, post_number, [str(ch["chat_id"]) for ch in targets])
+                sent_at = time.monotonic()
+                results = await fan_out_main_post(bot, targets, post_text)
+                latency = round(time.monotonic() - sent_at, 3)
+                await journal.result(sheet.id, m_name, post_number, {
+                    chat_id: message.message_id if message is not None else None for chat_id, message in results.items()
+                })
+                for chat_id, message in results.items():
+                    if message is not None:
+                        store.record_delivery(sheet.id, m_name, post_number, chat_id, message.message_id)
+                        delivered.add(chat_id)
+                if not any(message is not None for message in results.values()):
+                    nothing_sent = True
+                    logger.error(f"Пост №{post_number} ({m_name}) не удалось отправить ни в один канал.", extra={"post_number": post_number, "month": m_name})
+                    continue
+                mark(row_index, post_number, delivered, latency)
+                marked += 1
+            except resilience.DeadlineExceeded as e:
+                logger.warning(f"{e}. Посты с №{post_number} ({m_name}) будут опубликованы в следующий раз.", extra={"post_number": post_number, "month": m_name})
+                break
+            except Exception as e:
+                logger.error(f"Ошибка при публикации поста №{post_number} ({m_name}): {e}", exc_info=True, extra={"post_number": post_number, "month": m_name})
+            finally:
+                if _claimed(task):
+                    await coordination.release_post(sheet.id, m_name, post_number, sent=started and not nothing_sent)
+    finally:
+        for (_, post_number, _), task in zip(pending_posts, tasks):
+            task.cancel()
+            # Строки, взятые в аренду, но не дошедшие до отправки, сразу возвращаем другим репликам
+            if post_number not in processed and _claimed(task):
+                await coordination.release_post(sheet.id, m_name, post_number, sent=False)
+        # Все статусы прогона уходят в таблицу одним пакетом в конце
+        if marked:
+            await flush_status_updates(sheet)
+
+
+def _claimed(task):
+    # Задача подготовки завершилась с текстом — значит, строка в аренде у этой реплики
+    return task.done() and not task.cancelled() and task.exception() is None and task.result() is not None
+
+
+async def _prepare_post_text(sheet, m_name, post_number, topic, config, semaphore):
+    """Текст поста или None, если строку уже взяла другая реплика."""
+    store = get_store()
+    async with semaphore:
+        # Аренда берётся по мере продвижения очереди, поэтому реплики делят бэклог между собой
+        if not await coordination.claim_post(sheet.id, m_name, post_number):
+            return None
+        post_text = store.get_ready_post(sheet.id, m_name, post_number, topic, config["pregen_max_age_hours"] * 3600)
+        if post_text is not None:
+            return post_text
+        logger.debug(f"Готового текста для поста №{post_number} ({m_name}) нет, генерируем сразу.", extra={"post_number": post_number, "month": m_name})
         try:
-            # Изменённые тексты для основного поста:
-            post_text = await generate_post(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "Ты — опытный механик по ремонту спецтехники со стажем 30 лет и работаешь в компании СТАРЭКС уже более 5 лет."
-                            "Пиши максимально длинно (около 1500-2000 символов), подробно, профессионально и увлекательно, "
-                            "используя смайлы в тексте и заголовках, добавляй в пост всегда хэштеги, дай советы по обслуживанию и ремонту спецтехники, "
-                            "привлекай покупателей своим опытом и умением убеждать. В конце поста упомяни себя и компанию СТАРЭКС, "
-                            "у которой есть все необходимые запчасти и услуги для ремонта спецтехники."
-                        )
-                    },
-                    {
-                        "role": "user",
-                        "content": (
-                            f"Напиши подробный, красивый пост со смайликами на тему: '{topic}', поделись своим опытом как механика с опытом, "
-                            "дай советы по обслуживанию и ремонту спецтехники, используй смайлы и призывай читателей к действию. "
-                            "В конце упомяни СТАРЭКС и то, что у компании СТАРЭКС есть все для ремонта спецтехники."
-                        )
-                    },
-                ],
-                model=config["model_main"],
-                max_tokens=2000,
-                temperature=0.7,
-                max_len=config["main_post_max_len"],
-            )
-            await send_main_post(bot, config["chat_id"], post_text, config["bot_username"])
-            logger.info(f"Пост №{post_number} ({m_name}) опубликован.")
-            await update_status_sync(worksheet, row_index)
-        except Exception as e:
-            logger.error(f"Ошибка при публикации поста №{post_number} ({m_name}): {e}", exc_info=True)
+            post_text = await generate_main_post(topic, config)
+        except BaseException:
+            await coordination.release_post(sheet.id, m_name, post_number, sent=False)
+            raise
+    # Сохраняем сразу: если отправка сорвётся, следующий прогон не будет генерировать заново
+    store.save_ready_post(sheet.id, m_name, post_number, topic, post_text)
+    return post_text
@@ -0,0 +1,72 @@
+import re
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+
+def normalize(text):
+    # Регистр, пунктуация, смайлы и нумерация не влияют на сравнение
+    text = _NON_WORD.sub(" ", text.lower().replace("ё", "е"))
+    return " ".join(w for w in text.split() if not w.isdigit())
+
+
+def shingles(text, size=4):
+    """Множество символьных n-грамм нормализованного текста.
+
+    Символьные шинглы устойчивее к падежным окончаниям, чем пословные.
+    """
+    text = normalize(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def is_near_duplicate(candidate, others, threshold, size=4):
+    """True, если candidate похож на какой-то из текстов others не меньше чем на threshold."""
+    candidate_shingles = shingles(candidate, size)
+    return any(jaccard(candidate_shingles, shingles(other, size)) >= threshold for other in others)
+
+
+class ShingleIndex:
+    """Инвертированный индекс шинглов для проверки многих кандидатов по большому набору текстов.
+
+    Сравнивается только с текстами, у которых есть общие шинглы, а не со всеми подряд.
+    """
+
+    def __init__(self, texts=(), size=4):
+        self.size = size
+        self.sizes = []
+        self.postings = {}
+        for text in texts:
+            self.add(text)
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def add(self, text):
+        doc_id = len(self.sizes)
+        text_shingles = shingles(text, self.size)
+        self.sizes.append(len(text_shingles))
+        for shingle in text_shingles:
+            self.postings.setdefault(shingle, []).append(doc_id)
+
+    def max_similarity(self, text):
+        text_shingles = shingles(text, self.size)
+        if not text_shingles:
+            return 0.0
+        overlaps = {}
+        for shingle in text_shingles:
+            for doc_id in self.postings.get(shingle, ()):
+                overlaps[doc_id] = overlaps.get(doc_id, 0) + 1
+        return max(
+            (common / (len(text_shingles) + self.sizes[doc_id] - common) for doc_id, common in overlaps.items()),
+            default=0.0,
+        )
+
+    def is_near_duplicate(self, text, threshold):
+        return self.max_similarity(text) >= threshold
@@ -1,61 +1,139 @@
 import logging
 import asyncio
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.error import RetryAfter, TelegramError
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+from rate_limiter import TelegramRateLimiter
+import resilience
+import media_cache
+import metrics
 
 logger = logging.getLogger('post_bot.telegram_client')
 
-MAX_RETRIES = 3
-RETRY_DELAY = 5
+# Один ограничитель на процесс: его делят все отправки сообщений и фото
+rate_limiter = TelegramRateLimiter()
 
-async def safe_send_message(bot: Bot, **kwargs):
-    for attempt in range(1, MAX_RETRIES +1):
+
+def configure_rate_limiter(global_rate, chat_rate, group_per_minute):
+    global rate_limiter
+    rate_limiter = TelegramRateLimiter(global_rate, chat_rate, group_per_minute)
+
+
+_bots = {}
+
+
+def get_bot(token):
+    # Клиенты с одним токеном используют один Bot и его пул соединений
+    bot = _bots.get(token)
+    if bot is None:
+        bot = _bots[token] = Bot(token=token)
+    return bot
+
+
+async def _send(bot: Bot, method, what, **kwargs):
+    chat_id = kwargs.get("chat_id")
+
+    async def attempt():
+        await rate_limiter.acquire(chat_id)
         try:
-            res = await bot.send_message(**kwargs)
-            await asyncio.sleep(1)
-            return res
+            with metrics.timer("telegram_send_seconds", method=method):
+                return await getattr(bot, method)(**kwargs)
         except RetryAfter as e:
-            logger.warning(f"Flood control. Ждём {e.retry_after} сек. Попытка {attempt}/{MAX_RETRIES}.")
-            await asyncio.sleep(e.retry_after + 1)
-        except TelegramError as ex:
-            logger.error(f"Ошибка при отправке сообщения: {ex}", exc_info=True)
-            if attempt < MAX_RETRIES:
-                logger.info(f"Повтор через {RETRY_DELAY} секунд.")
-                await asyncio.sleep(RETRY_DELAY)
-            else:
-                logger.critical("Превышено кол-во попыток отправить сообщение.")
-                raise
+            # Блокируем чат в ограничителе сразу, чтобы паузу соблюдали и параллельные отправки
+            metrics.inc("telegram_flood_control_total")
+            rate_limiter.retry_after(chat_id, e.retry_after + 1)
+            raise
+
+    def on_retry(e, attempt_number, delay):
+        if isinstance(e, RetryAfter):
+            logger.warning(f"Flood control при отправке {what} в {chat_id}. Ждём {delay:.0f} сек. Попытка {attempt_number}.", extra={"chat_id": chat_id})
+        else:
+            logger.warning(f"Ошибка сети при отправке {what} в {chat_id}: {e}. Повтор через {delay:.1f} сек.", extra={"chat_id": chat_id})
+        metrics.inc("telegram_retries_total", method=method)
+
+    try:
+        return await resilience.call_with_retry(
+            attempt,
+            f"telegram.{method}",
+            breaker=resilience.get_breaker("telegram"),
+            # BadRequest/Forbidden не исправятся повтором, поэтому повторяем только сеть и flood control
+            retry_on=(RetryAfter, NetworkError),
+            should_retry=lambda e: not isinstance(e, BadRequest),
+            # RetryAfter — штатный ответ живого сервиса, предохранитель его не учитывает
+            is_failure=lambda e: not isinstance(e, RetryAfter),
+            retry_after=lambda e: e.retry_after + 1 if isinstance(e, RetryAfter) else None,
+            on_retry=on_retry,
+        )
+    except (TelegramError, resilience.CircuitOpenError, resilience.DeadlineExceeded) as ex:
+        logger.error(f"Ошибка при отправке {what} в {chat_id}: {ex}", extra={"chat_id": chat_id})
+        metrics.inc("telegram_failures_total", method=method)
+        raise
+
+
+async def safe_send_message(bot: Bot, **kwargs):
+    return await _send(bot, "send_message", "сообщения", **kwargs)
 
 async def safe_send_photo(bot: Bot, **kwargs):
-    for attempt in range(1, MAX_RETRIES +1):
-        try:
-            res = await bot.send_photo(**kwargs)
-            await asyncio.sleep(1)
-            return res
-        except RetryAfter as e:
-            logger.warning(f"Flood control при отправке фото. Ждём {e.retry_after} сек.")
-            await asyncio.sleep(e.retry_after + 1)
-        except TelegramError as ex:
-            logger.error(f"Ошибка при отправке фото: {ex}", exc_info=True)
-            if attempt < MAX_RETRIES:
-                logger.info(f"Повтор через {RETRY_DELAY} сек.")
-                await asyncio.sleep(RETRY_DELAY)
-            else:
-                logger.critical("Превышено кол-во попыток отправить фото.")
-                raise
-
-async def send_main_post(bot, chat_id, text, bot_username):
-    button = InlineKeyboardButton("Отправить заявку", url=f"https://t.me/{bot_username}?start=from_post")
-    markup = InlineKeyboardMarkup([[button]])
+    return await _send(bot, "send_photo", "фото", **kwargs)
+
+def _request_markup(bot_username, button_url=None):
+    url = button_url or f"https://t.me/{bot_username}?start=from_post"
+    button = InlineKeyboardButton("Отправить заявку", url=url)
+    return InlineKeyboardMarkup([[button]])
+
+async def send_main_post(bot, chat_id, text, bot_username, button_url=None):
+    markup = _request_markup(bot_username, button_url)
     try:
-        await safe_send_message(bot, chat_id=chat_id, text=text, reply_markup=markup)
+        return await safe_send_message(bot, chat_id=chat_id, text=text, reply_markup=markup)
     except Exception as e:
-        logger.error(f"Ошибка при отправке основного поста: {e}", exc_info=True)
+        logger.error(f"Ошибка при отправке основного поста в {chat_id}: {e}", exc_info=True)
+        return None
 
-async def send_second_post(bot, chat_id, image_url, text, bot_username):
-    button = InlineKeyboardButton("Отправить заявку", url=f"https://t.me/{bot_username}?start=from_post")
-    markup = InlineKeyboardMarkup([[button]])
+async def send_second_post(bot, chat_id, photo, text, bot_username, button_url=None):
+    markup = _request_markup(bot_username, button_url)
     try:
-        await safe_send_photo(bot, chat_id=chat_id, photo=image_url, caption=text, reply_markup=markup)
+        return await safe_send_photo(bot, chat_id=chat_id, photo=photo, caption=text, reply_markup=markup)
     except Exception as e:
-        logger.error(f"Ошибка при отправке второго поста: {e}", exc_info=True)
+        logger.error(f"Ошибка при отправке второго поста в {chat_id}: {e}", exc_info=True)
+        return None
+
+async def fan_out_main_post(bot, channels, text):
+    """Отправляет один и тот же пост во все каналы параллельно.
+
+    Возвращает {chat_id: Message или None}, None — отправка не удалась.
+    """
+    messages = await asyncio.gather(*(
+        send_main_post(bot, ch["chat_id"], text, ch.get("bot_username"), ch.get("button_url"))
+        for ch in channels
+    ))
+    return {str(ch["chat_id"]): message for ch, message in zip(channels, messages)}
+
+async def fan_out_second_post(bot, channels, image_source, text, retry_stale=True):
+    """Рассылает фото-пост; изображение загружается в Telegram один раз, дальше идёт file_id."""
+    file_id, fingerprint = await media_cache.resolve(bot, image_source)
+    results = {}
+    pending = list(channels)
+    if file_id is None and pending:
+        first = pending.pop(0)
+        message = await send_second_post(
+            bot, first["chat_id"], await media_cache.upload_payload(image_source), text,
+            first.get("bot_username"), first.get("button_url"),
+        )
+        results[str(first["chat_id"])] = message
+        media_cache.remember(bot, image_source, fingerprint, message)
+        if message is not None and message.photo:
+            file_id = message.photo[-1].file_id
+
+    photo = file_id or await media_cache.upload_payload(image_source)
+    messages = await asyncio.gather(*(
+        send_second_post(bot, ch["chat_id"], photo, text, ch.get("bot_username"), ch.get("button_url"))
+        for ch in pending
+    ))
+    results.update({str(ch["chat_id"]): message for ch, message in zip(pending, messages)})
+    if file_id and pending and all(message is None for message in messages):
+        # file_id мог протухнуть: забываем его и сразу повторяем рассылку с загрузкой файла,
+        # иначе пост этого слота пропадёт
+        media_cache.forget(bot, image_source)
+        if retry_stale:
+            logger.warning(f"Не удалось отправить фото по сохранённому file_id, загружаем {image_source} заново.")
+            results.update(await fan_out_second_post(bot, pending, image_source, text, retry_stale=False))
+    return results
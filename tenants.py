@@ -0,0 +1,130 @@
+import contextvars
+import datetime
+import functools
+import json
+import logging
+from contextlib import contextmanager
+
+import pytz
+
+import prompts
+from plan_store import get_store
+
+logger = logging.getLogger('post_bot.tenants')
+
+DEFAULT_TENANT = "default"
+
+# Общие для процесса настройки: пулы соединений, ограничители, метрики, plan.db.
+# В файле клиентов они игнорируются.
+SHARED_KEYS = {
+    "openai_api_key", "openai_base_url", "openai_timeout", "openai_connect_timeout", "openai_max_connections",
+    "telegram_global_rate", "telegram_chat_rate", "telegram_group_per_minute",
+    "metrics_port", "metrics_json_path", "metrics_json_interval", "plan_db_path", "journal_path",
+    "coord_db_path", "coord_replica_id", "coord_lease_seconds", "coord_heartbeat_seconds", "coord_row_lease_seconds",
+    "retry_max_attempts", "retry_base_delay", "retry_max_delay", "breaker_failures", "breaker_reset_seconds",
+}
+REQUIRED_KEYS = ("id", "spreadsheet_id", "telegram_token")
+
+
+class QuotaExceeded(Exception):
+    """Клиент исчерпал свою дневную квоту."""
+
+
+def load_tenants(config, path=None):
+    """Конфиги клиентов: общий config, дополненный настройками из файла клиентов.
+
+    Файл — JSON-список объектов с обязательными id, spreadsheet_id и telegram_token;
+    остальные ключи (каналы, промпты, расписание, квоты) переопределяют общие.
+    Без файла работает один клиент default из переменных окружения.
+    """
+    if not path:
+        return [{**config, "tenant_id": DEFAULT_TENANT}]
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    tenants = []
+    seen = set()
+    spreadsheets = set()
+    for entry in entries:
+        missing = [key for key in REQUIRED_KEYS if not entry.get(key)]
+        if missing:
+            raise ValueError(f"В описании клиента {entry.get('id', '?')} нет полей: {', '.join(missing)}.")
+        if not entry.get("channels") and not entry.get("chat_id"):
+            raise ValueError(f"Клиент {entry['id']}: нужно указать channels или chat_id.")
+        if entry["id"] in seen or ":" in entry["id"]:
+            raise ValueError(f"Некорректный или повторяющийся id клиента: {entry['id']}.")
+        seen.add(entry["id"])
+        # Зеркало в plan.db различает клиентов по id таблицы
+        if entry["spreadsheet_id"] in spreadsheets:
+            raise ValueError(f"Клиент {entry['id']}: таблица {entry['spreadsheet_id']} уже используется другим клиентом.")
+        spreadsheets.add(entry["spreadsheet_id"])
+        try:
+            prompts.validate(entry.get("prompts", {}))
+        except ValueError as e:
+            raise ValueError(f"Клиент {entry['id']}: {e}") from e
+        ignored = SHARED_KEYS & entry.keys()
+        if ignored:
+            logger.warning(f"Клиент {entry['id']}: общие настройки {', '.join(sorted(ignored))} игнорируются.")
+        tenant = {**config, **{k: v for k, v in entry.items() if k not in SHARED_KEYS}, "tenant_id": entry["id"]}
+        if "channels" not in entry:
+            tenant["channels"] = [{"chat_id": tenant["chat_id"], "bot_username": tenant["bot_username"]}]
+        if "image_urls" not in entry:
+            tenant["image_urls"] = [tenant["image_url"]]
+        tenants.append(tenant)
+    logger.info(f"Загружено клиентов: {len(tenants)}.")
+    return tenants
+
+
+_current = contextvars.ContextVar("tenant", default=None)
+
+
+@contextmanager
+def use(config):
+    token = _current.set(config)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def bind(config, func):
+    """Обёртка задачи планировщика: всё, что она запускает, считается работой клиента config."""
+    @functools.wraps(func)
+    async def run(*args):
+        with use(config):
+            return await func(*args)
+    return run
+
+
+def current():
+    """Конфиг клиента, в контексте которого идёт работа, или None."""
+    return _current.get()
+
+
+def today(config=None):
+    """Сегодняшняя дата в часовом поясе клиента (по умолчанию — текущего).
+
+    Дневные квоты и лимиты считаются по ней, а не по часам хоста:
+    на сервере в UTC сутки иначе сбрасывались бы посреди дня публикаций.
+    """
+    config = config or _current.get()
+    if not config:
+        return datetime.date.today()
+    return datetime.datetime.now(pytz.timezone(config["timezone"])).date()
+
+
+def current_id():
+    config = _current.get()
+    return config["tenant_id"] if config else DEFAULT_TENANT
+
+
+def charge_openai():
+    """Учитывает запрос к OpenAI в дневной квоте текущего клиента (openai_daily_calls, 0 — без лимита)."""
+    config = _current.get()
+    if not config or not config.get("openai_daily_calls"):
+        return
+    store = get_store()
+    key = f"openai_calls:{config['tenant_id']}:{today(config).isoformat()}"
+    calls = int(store.get_value(key) or 0)
+    if calls >= config["openai_daily_calls"]:
+        raise QuotaExceeded(f"Клиент {config['tenant_id']}: дневная квота запросов к OpenAI ({calls}) исчерпана.")
+    store.set_value(key, str(calls + 1))
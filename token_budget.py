@@ -0,0 +1,79 @@
+import logging
+
+import metrics
+import tenants
+from plan_store import get_store
+
+logger = logging.getLogger('post_bot.token_budget')
+
+# Грубая оценка для ответов, прерванных до чанка с usage (русский текст — около 3 символов на токен)
+CHARS_PER_TOKEN = 3
+MIN_MAX_TOKENS = 200
+
+
+class BudgetDeferred(Exception):
+    """Второстепенная генерация отложена: бюджет токенов клиента почти исчерпан."""
+
+
+def pressure(config):
+    """Доля израсходованного бюджета: максимум по дневному и месячному лимиту (0 — лимитов нет)."""
+    today = tenants.today(config).isoformat()
+    store = get_store()
+    shares = []
+    if config.get("token_budget_daily"):
+        shares.append(store.tokens_used(config["tenant_id"], today) / config["token_budget_daily"])
+    if config.get("token_budget_monthly"):
+        shares.append(store.tokens_used(config["tenant_id"], today[:7]) / config["token_budget_monthly"])
+    return max(shares, default=0.0)
+
+
+def plan(model, max_tokens, priority="normal"):
+    """Модель и max_tokens для запроса с учётом бюджета текущего клиента.
+
+    После token_budget_soft доли бюджета запросы priority="low" откладываются (BudgetDeferred),
+    остальные идут на запасную модель (model_main_fallback/model_second_fallback)
+    с max_tokens, урезанным в token_budget_trim раз. Основные посты не блокируются
+    и после исчерпания бюджета: публикация по расписанию важнее.
+    """
+    config = tenants.current()
+    if not config:
+        return model, max_tokens
+    share = pressure(config)
+    if share < config.get("token_budget_soft", 0.8):
+        return model, max_tokens
+    if priority == "low":
+        metrics.inc("openai_budget_deferred_total", tenant=config["tenant_id"])
+        raise BudgetDeferred(f"Клиент {config['tenant_id']}: израсходовано {share:.0%} бюджета токенов.")
+    fallbacks = {
+        config.get("model_main"): config.get("model_main_fallback"),
+        config.get("model_second"): config.get("model_second_fallback"),
+    }
+    planned_model = fallbacks.get(model) or model
+    planned_tokens = max(MIN_MAX_TOKENS, int(max_tokens * config.get("token_budget_trim", 0.75)))
+    if share >= 1:
+        logger.warning(f"Бюджет токенов исчерпан ({share:.0%}), запрос идёт в экономном режиме.", extra={"model": planned_model})
+    else:
+        logger.info(f"Израсходовано {share:.0%} бюджета токенов: модель {planned_model}, max_tokens={planned_tokens}.", extra={"model": planned_model})
+    metrics.inc("openai_budget_downshifts_total", tenant=config["tenant_id"], model=planned_model)
+    return planned_model, min(max_tokens, planned_tokens)
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def max_tokens_for(max_len):
+    """max_tokens для текста до max_len символов: с запасом 20%, чтобы ответ заканчивался сам,
+    а trim_to_boundary срезал только хвост, а не оплаченную половину текста."""
+    return int(max_len / CHARS_PER_TOKEN * 1.2)
+
+
+def record(model, prompt_tokens, completion_tokens):
+    """Учитывает токены одного вызова в расходе текущего клиента за сегодня."""
+    get_store().add_token_usage(
+        tenants.today().isoformat(),
+        tenants.current_id(),
+        model,
+        prompt_tokens,
+        completion_tokens,
+    )
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import math
+import random
+import re
+
+import coordination
+import prompts
+from openai_client import generate_post
+from plan_store import get_store
+from similarity import ShingleIndex
+
+logger = logging.getLogger('post_bot.topic_planner')
+
+# Сколько уже известных тем показываем модели, чтобы она не предлагала их снова
+PROMPT_EXAMPLES = 30
+
+# Фоновое пополнение запаса по таблицам и блокировки, чтобы пакеты не шли параллельно
+_refilling = {}
+_locks = {}
+
+
+def topic_messages(config, count, avoid):
+    messages = prompts.render(config, "topics", count=count)
+    if avoid:
+        messages[-1]["content"] += " Не повторяй эти темы, они уже были:\n" + "\n".join(f"- {t}" for t in avoid)
+    return messages
+
+
+def parse_topics(response):
+    topics = [re.sub(r'^(\d+[.)]|[-•*])\s*', '', t.strip()).strip() for t in response.split('\n')]
+    return [t for t in topics if t]
+
+
+async def refill(spreadsheet_id, config, target):
+    """Пополняет запас тем до target пакетными запросами.
+
+    Каждая новая тема сверяется с индексом шинглов всех известных тем
+    (запас, выданные раньше, темы из листов); похожие отбрасываются.
+    Пакеты одной таблицы идут по очереди, поэтому срочное пополнение
+    ждёт не больше одного пакета фонового.
+    """
+    store = get_store()
+    lock = _locks.setdefault(spreadsheet_id, asyncio.Lock())
+    shortfall = target - store.planned_count(spreadsheet_id)
+    if shortfall <= 0:
+        return 0
+
+    max_calls = math.ceil(shortfall / config["topic_batch_size"]) + config["topic_extra_calls"]
+    logger.info(f"Планируем {shortfall} тем вперёд (в запасе {target - shortfall}).")
+    added = 0
+    for _ in range(max_calls):
+        async with lock:
+            # Запас мог пополнить параллельный вызов — пересчитываем
+            missing = target - store.planned_count(spreadsheet_id)
+            if missing <= 0:
+                break
+            # Пакет всегда полный: лишние темы не пропадают, а остаются в запасе на следующие месяцы
+            added += await _refill_batch(spreadsheet_id, config, config["topic_batch_size"])
+    shortfall = target - store.planned_count(spreadsheet_id)
+    if shortfall > 0:
+        logger.warning(f"Не удалось запланировать ещё {shortfall} тем.")
+    return added
+
+
+async def _refill_batch(spreadsheet_id, config, count):
+    store = get_store()
+    known = store.known_topics(spreadsheet_id)
+    index = ShingleIndex(known)
+    response = await generate_post(
+        messages=topic_messages(config, count, random.sample(known, min(PROMPT_EXAMPLES, len(known)))),
+        model=config["model_main"],
+        # Примерно 40 токенов на тему с нумерацией
+        max_tokens=count * 40 + 200,
+        temperature=0.9,
+        max_len=count * 200,
+    )
+    candidates = parse_topics(response)
+    fresh = []
+    for topic in candidates:
+        if index.is_near_duplicate(topic, config["topic_similarity"]):
+            continue
+        index.add(topic)
+        fresh.append(topic)
+    fresh = fresh[:count]
+    store.add_planned_topics(spreadsheet_id, fresh)
+    logger.debug(f"Планировщик тем: получено {len(candidates)}, новых {len(fresh)}.")
+    return len(fresh)
+
+
+def start_refill(spreadsheet_id, config):
+    """Пополнение запаса до topic_horizon_days в фоне: новый месяц его не ждёт.
+
+    Запас нужен только той реплике, что создаёт листы, поэтому пополняет его ведущая.
+    """
+    if spreadsheet_id in _refilling or not coordination.is_leader():
+        return
+    task = asyncio.create_task(_background_refill(spreadsheet_id, config))
+    _refilling[spreadsheet_id] = task
+    task.add_done_callback(lambda _: _refilling.pop(spreadsheet_id, None))
+
+
+async def _background_refill(spreadsheet_id, config):
+    try:
+        await refill(spreadsheet_id, config, config["topic_horizon_days"])
+    except Exception as e:
+        logger.error(f"Ошибка фонового планирования тем: {e}", exc_info=True)
+
+
+async def take_topics(spreadsheet_id, month, count, config):
+    """Темы для месяца из запаса; сразу генерирует только недостающие для месяца,
+    остальной горизонт планирования пополняется в фоне."""
+    store = get_store()
+    if store.planned_count(spreadsheet_id) < count:
+        try:
+            await refill(spreadsheet_id, config, count)
+        except Exception as e:
+            logger.error(f"Ошибка планирования тем: {e}", exc_info=True)
+    topics = store.take_planned_topics(spreadsheet_id, month, count)
+    logger.debug(f"Для {month} взято {len(topics)} тем из запаса, осталось {store.planned_count(spreadsheet_id)}.")
+    if store.planned_count(spreadsheet_id) < config["topic_horizon_days"]:
+        start_refill(spreadsheet_id, config)
+    return topics